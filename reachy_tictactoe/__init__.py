@@ -1 +1,6 @@
-from .tictactoe_playground import TictactoePlayground  # noqa: F401
+def __getattr__(name):
+    # The playground pulls in the Reachy SDK, keep it out of the package import.
+    if name == 'TictactoePlayground':
+        from .tictactoe_playground import TictactoePlayground
+        return TictactoePlayground
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
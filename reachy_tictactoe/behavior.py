@@ -1,17 +1,19 @@
-import time
 import logging
 import numpy as np
 
 from threading import Event, Thread
 from pyquaternion import Quaternion
 
+from .clock import default_clock
+
 
 logger = logging.getLogger('reachy.tictactoe.behavior')
 
 
 class FollowHand(object):
-    def __init__(self, reachy):
+    def __init__(self, reachy, clock=default_clock):
         self.reachy = reachy
+        self.clock = clock
         self.running = Event()
 
     def start(self):
@@ -41,7 +43,7 @@ class FollowHand(object):
             except ValueError:
                 pass
 
-            time.sleep(0.01)
+            self.clock.sleep(0.01, reason='follow_hand')
 
 
 def head_home(reachy, duration):
@@ -52,7 +54,7 @@ def head_home(reachy, duration):
     }, duration=duration, wait=True, interpolation_mode='minjerk')
 
 
-def sad(reachy):
+def sad(reachy, clock=default_clock):
     logger.info('Starting behavior', extra={'behavior': 'sad'})
 
     pos = [
@@ -74,7 +76,7 @@ def sad(reachy):
     logger.info('Ending behavior', extra={'behavior': 'sad'})
 
 
-def happy(reachy):
+def happy(reachy, clock=default_clock):
     logger.info('Starting behavior', extra={'behavior': 'happy'})
 
     q = Quaternion(axis=[1, 0, 0], angle=np.deg2rad(-15))
@@ -87,15 +89,15 @@ def happy(reachy):
     for p in pos:
         reachy.head.left_antenna.goal_position = p
         reachy.head.right_antenna.goal_position = -p
-        time.sleep(0.01)
+        clock.sleep(0.01, reason='behavior')
 
-    time.sleep(1)
+    clock.sleep(1, reason='behavior')
     head_home(reachy, duration=1)
 
     logger.info('Ending behavior', extra={'behavior': 'happy'})
 
 
-def surprise(reachy):
+def surprise(reachy, clock=default_clock):
     logger.info('Starting behavior', extra={'behavior': 'suprise'})
 
     q = Quaternion(axis=[1, 0, 0], angle=np.deg2rad(22))
@@ -107,7 +109,7 @@ def surprise(reachy):
         }, duration=0.3, wait=True,
     )
 
-    time.sleep(1)
+    clock.sleep(1, reason='behavior')
     head_home(reachy, duration=1)
 
     logger.info('Ending behavior', extra={'behavior': 'suprise'})
@@ -0,0 +1,110 @@
+import numpy as np
+
+from .utils import piece2id, id2piece, piece2player
+
+
+# A board is 9 piece ids (see utils.piece2id) and is encoded as the base-3
+# integer whose most significant digit is the first box. This is also the
+# flat index of the board in a (3, ) * 9 array, such as the agent Q-tables.
+POW3 = 3 ** np.arange(8, -1, -1)
+NB_CODES = 3 ** 9
+
+EMPTY = piece2id['none']
+
+WIN_LINES = np.array((
+    (0, 1, 2),
+    (3, 4, 5),
+    (6, 7, 8),
+
+    (0, 3, 6),
+    (1, 4, 7),
+    (2, 5, 8),
+
+    (0, 4, 8),
+    (2, 4, 6),
+))
+
+BITS = 1 << np.arange(9)
+# The 9-bit masks of the winning lines and, for every 9-bit mask, whether
+# it contains one of them.
+LINE_MASKS = np.array([np.sum(BITS[line]) for line in WIN_LINES])
+HAS_LINE = np.array([
+    np.any((mask & LINE_MASKS) == LINE_MASKS) for mask in range(1 << 9)
+])
+
+NO_WINNER = 255
+
+
+def encode(board):
+    return int(np.dot(board, POW3))
+
+
+def encode_many(boards):
+    return np.asarray(boards, dtype=np.int64) @ POW3
+
+
+def decode(code):
+    return ((code // POW3) % 3).astype(np.uint8)
+
+
+def _build_tables():
+    boards = decode(np.arange(NB_CODES)[:, np.newaxis])
+
+    # masks[code, id] is the 9-bit mask of the boxes holding piece id.
+    masks = np.stack([(boards == i) @ BITS for i in range(3)], axis=1).astype(np.uint16)
+    counts = np.stack([np.sum(boards == i, axis=1) for i in range(3)], axis=1).astype(np.uint8)
+
+    # Lines are checked in the same order as they always were: the first
+    # line (in WIN_LINES order) filled by a player's piece wins.
+    winners = np.full(NB_CODES, NO_WINNER, dtype=np.uint8)
+    for line in WIN_LINES[::-1]:
+        for i in reversed(list(id2piece.keys())):
+            if piece2player[id2piece[i]] not in ('robot', 'human'):
+                continue
+            winners[np.all(boards[:, line] == i, axis=1)] = i
+
+    final = (winners != NO_WINNER) | (counts[:, EMPTY] == 0)
+
+    return masks, counts, winners, final
+
+
+MASKS, COUNTS, WINNERS, FINAL = _build_tables()
+
+
+def reachable_codes():
+    """Codes of every board reachable from the empty one, whoever starts."""
+    counts = COUNTS[:, 1:].astype(np.int64)
+    nb_pieces = counts.sum(axis=1)
+
+    reachable = np.zeros(NB_CODES, dtype=bool)
+    reachable[0] = True
+
+    for n in range(9):
+        codes = np.where(reachable & (nb_pieces == n) & ~FINAL)[0]
+        for player in (1, 2):
+            # A player can't be two pieces ahead of the other one.
+            can_play = counts[codes, player - 1] <= counts[codes, 2 - player]
+            for box in range(9):
+                empty = (MASKS[codes, EMPTY] >> box) & 1 == 1
+                reachable[codes[can_play & empty] + player * POW3[box]] = True
+
+    return np.where(reachable)[0]
+
+
+def winner(board):
+    """Player ('robot', 'human' or 'nobody') who has completed a line."""
+    w = WINNERS[encode(board)]
+    return 'nobody' if w == NO_WINNER else piece2player[id2piece[w]]
+
+
+def is_final(board):
+    return bool(FINAL[encode(board)])
+
+
+def legal_moves(board):
+    mask = int(MASKS[encode(board), EMPTY])
+    return [i for i in range(9) if mask & (1 << i)]
+
+
+def count(board, piece):
+    return int(COUNTS[encode(board), piece2id[piece]])
@@ -0,0 +1,70 @@
+import numpy as np
+
+from .utils import piece2id
+
+
+class BoardFilter(object):
+    """Fuses the classification of successive frames into a stable board.
+
+    Every box keeps an exponential moving average of the probability of
+    each piece id. The classifiers only give their top label and score, so
+    the rest of the probability is spread over the other pieces. A box only
+    switches to another piece once that piece is likely enough, so a single
+    misclassified frame (a reflection, a hand over the board) doesn't change
+    the board.
+
+    As the single frame reading always did, a box read with a score under
+    min_score is taken as empty, with that score. min_score must be at least
+    min_confidence, so a box read the same way over and over always settles.
+    """
+
+    nb_pieces = 3
+
+    def __init__(self, alpha=0.35, min_confidence=0.8, min_score=0.9):
+        if min_score < min_confidence:
+            raise ValueError(f'min_score ({min_score}) must be at least min_confidence ({min_confidence}).')
+
+        self.alpha = alpha
+        self.min_confidence = min_confidence
+        self.min_score = min_score
+        self.reset()
+
+    def reset(self):
+        self.probabilities = None
+        self.board = None
+
+    def update(self, cells, scores):
+        cells = np.asarray(cells).reshape(-1)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+
+        unsure = scores < self.min_score
+        cells = np.where(unsure, piece2id['none'], cells)
+        scores = np.where(unsure, self.min_score, scores)
+
+        likelihoods = np.repeat(((1 - scores) / (self.nb_pieces - 1))[:, np.newaxis], self.nb_pieces, axis=1)
+        likelihoods[np.arange(len(cells)), cells] = scores
+
+        if self.probabilities is None:
+            self.probabilities = likelihoods
+            self.board = cells.astype(np.uint8)
+        else:
+            self.probabilities += self.alpha * (likelihoods - self.probabilities)
+
+            switch = self.confidence >= self.min_confidence
+            self.board[switch] = np.argmax(self.probabilities[switch], axis=1)
+
+        return self.board.copy(), self.confidence
+
+    @property
+    def confidence(self):
+        # Probability of the most likely piece of every box.
+        return np.max(self.probabilities, axis=1)
+
+    @property
+    def stable(self):
+        """Whether every box is confidently the piece it is reported as."""
+        if self.probabilities is None:
+            return False
+
+        board_probabilities = self.probabilities[np.arange(len(self.board)), self.board]
+        return bool(np.all(board_probabilities >= self.min_confidence))
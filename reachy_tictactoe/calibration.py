@@ -0,0 +1,202 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+from .detect_board import corners_to_cases, get_board_corners
+from .packed import load_arrays, save_arrays
+from .vision import board_homography
+
+
+logger = logging.getLogger('reachy.tictactoe.calibration')
+
+
+# The calibration belongs to the robot, not to the package, so it's kept
+# with the user state.
+state_path = os.path.join(
+    os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state'),
+    'reachy-tictactoe',
+)
+calibration_path = os.environ.get(
+    'REACHY_TICTACTOE_CALIBRATION',
+    os.path.join(state_path, 'board-calibration.pack'),
+)
+
+
+class BoardCalibration(object):
+    """Geometry of the board grid in the camera frame.
+
+    corners[h, v] is the (x, y) intersection of the horizontal line h and
+    the vertical line v. The homography maps the canonical board (see
+    vision.board_homography) to the frame. The patches around the corners,
+    as seen when calibrating, are kept to check if the board has moved since.
+    """
+
+    patch_radius = 12
+
+    def __init__(self, corners, patches):
+        self.corners = np.asarray(corners, dtype=np.int32)
+        self.patches = patches
+
+        self.cases = corners_to_cases(self.corners)
+        self.homography = board_homography(
+            [self.corners[i, j] for i, j in ((0, 0), (0, -1), (-1, -1), (-1, 0))]
+        )
+
+    @classmethod
+    def from_image(cls, img):
+        """Detect the board in img, raises ValueError if it can't."""
+        corners = get_board_corners(img)
+        cases = corners_to_cases(corners)
+
+        height, width = img.shape[:2]
+        r = cls.patch_radius
+        x, y = corners[..., 0], corners[..., 1]
+        if np.any((x < r) | (x >= width - r) | (y < r) | (y >= height - r)):
+            raise ValueError('Board corners out of the frame')
+        if np.any(cases[..., 1] - cases[..., 0] < 2 * r) or np.any(cases[..., 3] - cases[..., 2] < 2 * r):
+            raise ValueError('Board cases too small')
+
+        return cls(corners, cls.extract_patches(img, corners))
+
+    @classmethod
+    def extract_patches(cls, img, corners):
+        """Grayscale patches around the corners, zero-mean and unit-norm."""
+        r = cls.patch_radius
+
+        patches = np.stack([
+            img[y - r:y + r, x - r:x + r].mean(axis=2)
+            for x, y in corners.reshape(-1, 2)
+        ])
+        patches -= patches.mean(axis=(1, 2), keepdims=True)
+        patches /= np.linalg.norm(patches, axis=(1, 2), keepdims=True) + 1e-6
+
+        return patches.astype(np.float32)
+
+    def drift(self, img):
+        """How much the corners changed since the calibration, in [0, 2].
+
+        This is 1 minus the mean normalized correlation of the corner
+        patches, so it's about 0 when the board hasn't moved.
+        """
+        patches = self.extract_patches(img, self.corners)
+        return 1 - float(np.mean(np.sum(patches * self.patches, axis=(1, 2))))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        save_arrays(path, {
+            'corners': self.corners,
+            'patches': self.patches,
+            'homography': self.homography,
+        }, meta={'created': time.time()})
+
+    @classmethod
+    def load(cls, path):
+        arrays, _ = load_arrays(path, mmap=False)
+        return cls(arrays['corners'], arrays['patches'])
+
+
+class Calibrator(object):
+    """Keeps the board calibration up to date from the camera frames.
+
+    Checking the drift of the board costs a fraction of a millisecond per
+    frame, the full detection only runs when the board has drifted for
+    patience frames in a row (so a hand passing by doesn't trigger it), at
+    most once every retry_period frames, and on valid boards only.
+
+    The first calibration is never automatic: until there is one (see the
+    __main__ of this module), the fixed vision.board_cases are used.
+    """
+
+    def __init__(self, path=calibration_path, max_drift=0.25, patience=5, retry_period=300):
+        self.path = path
+        self.max_drift = max_drift
+        self.patience = patience
+        self.retry_period = retry_period
+
+        self.calibration = None
+        self.nb_drifting = 0
+        self.frames_since_attempt = retry_period
+
+    def load(self):
+        try:
+            self.calibration = BoardCalibration.load(self.path)
+        except (OSError, ValueError, KeyError):
+            logger.warning(
+                'No board calibration found, using the fixed board cases. '
+                'Run python -m reachy_tictactoe.calibration on a frame of the board to calibrate it.',
+                extra={'path': self.path},
+            )
+            return False
+        return True
+
+    @property
+    def board_cases(self):
+        """The calibrated cases, None if the board was never calibrated."""
+        return self.calibration.cases if self.calibration is not None else None
+
+    @property
+    def homography(self):
+        """The calibrated homography, None if the board was never calibrated."""
+        return self.calibration.homography if self.calibration is not None else None
+
+    def update(self, img, is_valid=None):
+        """Check the board drift, and recalibrate if needed.
+
+        is_valid is a callable telling if img shows a valid board, only
+        called before recalibrating. Returns True when the calibration
+        changed.
+        """
+        self.frames_since_attempt += 1
+
+        if self.calibration is None:
+            return False
+
+        drift = self.calibration.drift(img)
+        self.nb_drifting = self.nb_drifting + 1 if drift > self.max_drift else 0
+        if self.nb_drifting < self.patience:
+            return False
+
+        if self.frames_since_attempt < self.retry_period:
+            return False
+        if is_valid is not None and not is_valid():
+            return False
+
+        self.frames_since_attempt = 0
+        return self.recalibrate(img)
+
+    def recalibrate(self, img):
+        try:
+            calibration = BoardCalibration.from_image(img)
+        except ValueError as e:
+            logger.warning('Board calibration failed', extra={'error': str(e)})
+            return False
+
+        self.calibration = calibration
+        self.nb_drifting = 0
+        logger.info('Board calibrated', extra={'cases': calibration.cases.tolist()})
+
+        try:
+            calibration.save(self.path)
+        except OSError as e:
+            logger.warning('Could not save the board calibration', extra={'error': str(e)})
+
+        return True
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import cv2 as cv
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('image')
+    parser.add_argument('--output', default=calibration_path)
+    args = parser.parse_args()
+
+    calibration = BoardCalibration.from_image(cv.imread(args.image))
+    calibration.save(args.output)
+
+    print(f'Saved the board calibration to {args.output}:')
+    print(calibration.cases)
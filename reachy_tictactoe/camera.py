@@ -0,0 +1,134 @@
+import logging
+
+import numpy as np
+
+from collections import namedtuple
+from threading import Condition, Event, Thread
+
+from .clock import default_clock
+
+
+logger = logging.getLogger('reachy.tictactoe.camera')
+
+
+# index is the number of frames captured before this one.
+Frame = namedtuple('Frame', ('img', 'timestamp', 'index'))
+
+
+class CameraStream(object):
+    """Continuously reads a camera in a background thread.
+
+    Frames are copied into a small preallocated ring buffer along with the
+    time they were captured at, so the vision can get the latest frame
+    right away instead of polling the camera (and getting the stale frames
+    it may have buffered).
+
+    Failed reads (e.g. a disconnected camera) are retried after a backoff
+    doubling from min_backoff up to max_backoff.
+    """
+
+    def __init__(self, camera, clock=default_clock, nb_frames=4, min_backoff=0.01, max_backoff=0.5):
+        self.camera = camera
+        self.clock = clock
+        self.nb_frames = nb_frames
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.frames = None
+        self.timestamps = np.full(nb_frames, -np.inf)
+        # Number of frames captured so far, the latest one is in slot (count - 1) % nb_frames.
+        self.count = 0
+        self.nb_failures = 0
+
+        self._new_frame = Condition()
+        self._running = Event()
+        self._t = None
+
+    def start(self):
+        if self._t is not None:
+            return
+
+        logger.info('Starting the camera stream')
+        self._running.set()
+        self._t = Thread(target=self._capture, daemon=True)
+        self._t.start()
+
+    def stop(self):
+        if self._t is None:
+            return
+
+        logger.info('Stopping the camera stream')
+        self._running.clear()
+        self._t.join()
+        self._t = None
+
+    def _capture(self):
+        while self._running.is_set():
+            # The read blocks until the next frame is available, so the frame
+            # is at least as recent as a timestamp taken before the call.
+            timestamp = self.clock.time()
+            success, img = self.camera.read()
+
+            if not success or img is None or len(img) == 0:
+                self._failed()
+                continue
+
+            if self.nb_failures > 0:
+                logger.info('Camera reads again', extra={'nb_failures': self.nb_failures})
+                self.nb_failures = 0
+
+            with self._new_frame:
+                if self.frames is None or self.frames.shape[1:] != img.shape:
+                    self.frames = np.empty((self.nb_frames, ) + img.shape, dtype=img.dtype)
+
+                slot = self.count % self.nb_frames
+                self.frames[slot] = img
+                self.timestamps[slot] = timestamp
+                self.count += 1
+
+                self._new_frame.notify_all()
+
+    def _failed(self):
+        self.nb_failures += 1
+        if self.nb_failures in (1, 10, 100) or self.nb_failures % 1000 == 0:
+            logger.warning('Camera read failed', extra={'nb_failures': self.nb_failures})
+
+        backoff = min(self.min_backoff * 2 ** (self.nb_failures - 1), self.max_backoff)
+        self.clock.sleep(backoff, reason=None)
+
+    @property
+    def latest_timestamp(self):
+        if self.count == 0:
+            return None
+        return self.timestamps[(self.count - 1) % self.nb_frames]
+
+    def frame_age(self):
+        """Time since the latest frame was captured, None before the first one."""
+        timestamp = self.latest_timestamp
+        if timestamp is None:
+            return None
+        return self.clock.time() - timestamp
+
+    def get_latest(self, min_timestamp=None, after=None, timeout=0, reason='wait_for_frame'):
+        """Latest frame captured at or after min_timestamp.
+
+        If after is given, the frame must also be more recent than the
+        frame of that index. Waits up to timeout for such a frame to
+        arrive through the clock, and returns None if none did (e.g. the
+        camera stalled).
+        """
+        if min_timestamp is None:
+            min_timestamp = -np.inf
+        min_count = 1 if after is None else after + 2
+
+        def fresh():
+            return self.count >= min_count and self.latest_timestamp >= min_timestamp
+
+        if not self.clock.wait_for(self._new_frame, fresh, timeout=timeout, reason=reason):
+            return None
+
+        with self._new_frame:
+            index = self.count - 1
+            slot = index % self.nb_frames
+            # The slot will be overwritten by the capture thread.
+            return Frame(self.frames[slot].copy(), self.timestamps[slot], index)
@@ -0,0 +1,57 @@
+import numpy as np
+
+from .vision import board_cases
+
+
+class ChangeDetector(object):
+    """Tells which boxes of the board changed since they were last classified.
+
+    Every box is compared as a downsampled grayscale thumbnail to the one of
+    the frame it was last classified on. This costs a fraction of a
+    millisecond, so the classifiers only need to run on the boxes where
+    something actually moved.
+    """
+
+    def __init__(self, cases=None, step=8, threshold=12.0, max_age=30):
+        if cases is None:
+            cases = board_cases
+        # The flattened board is the reverse of the cases order (see
+        # vision.get_board_cells).
+        self.cases = np.asarray(cases).reshape(-1, 4)[::-1]
+        self.step = step
+        self.threshold = threshold
+        # Boxes are classified again after max_age frames without change
+        # anyway, in case of a slow drift of the image.
+        self.max_age = max_age
+
+        self.reset()
+
+    def reset(self):
+        self.references = [None] * len(self.cases)
+        self.ages = np.zeros(len(self.cases), dtype=int)
+
+    def thumbnails(self, img):
+        s = self.step
+        return [
+            img[ly:ry:s, lx:rx:s].mean(axis=2)
+            for lx, rx, ly, ry in self.cases
+        ]
+
+    def changed(self, img):
+        """Mask of the boxes whose content changed, with their thumbnails."""
+        thumbnails = self.thumbnails(img)
+
+        changed = np.array([
+            reference is None or np.mean(np.abs(thumbnail - reference)) > self.threshold
+            for thumbnail, reference in zip(thumbnails, self.references)
+        ])
+        changed |= self.ages >= self.max_age
+
+        return changed, thumbnails
+
+    def update(self, thumbnails, boxes):
+        """Mark the boxes as classified on the frame of these thumbnails."""
+        self.ages += 1
+        for box in boxes:
+            self.references[box] = thumbnails[box]
+            self.ages[box] = 0
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from collections import defaultdict
+
+
+class Clock(object):
+    """Clock through which the playground waits.
+
+    Every wait is accounted under a reason, so we can tell how much of a
+    turn is spent idling and why, except the ones without reason (e.g. of
+    the background threads). Waits should rather use wait_until with the
+    condition they actually wait for than a fixed sleep.
+    """
+
+    def __init__(self):
+        # reason -> [number of waits, total waiting time]
+        self.waits = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+
+    def time(self):
+        return time.monotonic()
+
+    def sleep(self, duration, reason='sleep'):
+        self._sleep(duration)
+        self._account(reason, duration)
+
+    def wait_until(self, condition, timeout, period=0.01, reason='wait'):
+        """Wait until condition() is true, returns False on timeout."""
+        start = self.time()
+        # An absolute deadline, the remaining time can be too small to move
+        # a (simulated) clock forward.
+        deadline = start + timeout
+
+        while True:
+            if condition():
+                success = True
+                break
+
+            now = self.time()
+            if now >= deadline:
+                success = False
+                break
+
+            self._sleep_until(min(now + period, deadline))
+
+        self._account(reason, self.time() - start)
+        return success
+
+    def wait_for(self, condition, predicate, timeout, reason='wait'):
+        """Wait on a threading.Condition until predicate() is true.
+
+        Unlike wait_until, this does not poll: the thread sleeps until the
+        condition is notified. Returns False on timeout.
+        """
+        start = self.time()
+
+        with condition:
+            success = condition.wait_for(predicate, timeout=timeout)
+
+        self._account(reason, self.time() - start)
+        return success
+
+    def idle_report(self):
+        with self._lock:
+            return {
+                reason: {'count': count, 'duration': duration}
+                for reason, (count, duration) in self.waits.items()
+            }
+
+    def reset_accounting(self):
+        with self._lock:
+            self.waits.clear()
+
+    def _sleep(self, duration):
+        time.sleep(duration)
+
+    def _sleep_until(self, t):
+        self._sleep(t - self.time())
+
+    def _account(self, reason, duration):
+        if reason is None:
+            return
+
+        with self._lock:
+            stats = self.waits[reason]
+            stats[0] += 1
+            stats[1] += duration
+
+
+class SimulatedClock(Clock):
+    """Clock whose time only moves when the main thread sleeps.
+
+    Background threads (antennas animations, idle behaviors) run alongside
+    the main thread on the robot, so their sleeps don't move the clock.
+    """
+
+    def __init__(self, start=0.0):
+        Clock.__init__(self)
+        self._now = start
+
+    def time(self):
+        return self._now
+
+    def advance(self, duration):
+        # Time spent by the (simulated) hardware, not accounted as idle.
+        if threading.current_thread() is threading.main_thread():
+            with self._lock:
+                self._now += max(duration, 0)
+        else:
+            time.sleep(0)
+
+    def _sleep(self, duration):
+        self.advance(duration)
+
+    def _sleep_until(self, t):
+        # Jump to t exactly, t - time() may not add up to it.
+        if threading.current_thread() is threading.main_thread():
+            with self._lock:
+                self._now = max(self._now, t)
+        else:
+            time.sleep(0)
+
+
+default_clock = Clock()
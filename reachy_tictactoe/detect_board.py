@@ -1,10 +1,64 @@
-import cv2 as cv
 import numpy as np
 
-from sklearn.cluster import KMeans
+
+def cluster_1d(values, nb_clusters=4, nb_iterations=10):
+    """Cluster 1-D values, returns the label of each value.
+
+    Labels are ordered by increasing cluster position. The clusters are
+    first split at the largest gaps between the sorted values, then refined
+    with a few Lloyd iterations, which on sorted data only move the
+    boundaries between consecutive clusters.
+    """
+    values = np.asarray(values, dtype=np.float64).reshape(-1)
+
+    order = np.argsort(values)
+    sorted_values = values[order]
+    if len(np.unique(sorted_values)) < nb_clusters:
+        raise ValueError(f'Need at least {nb_clusters} distinct values to find {nb_clusters} clusters')
+
+    # Index (in sorted_values) of the first value of every cluster but the first one.
+    gaps = np.diff(sorted_values)
+    splits = np.sort(np.argpartition(gaps, -(nb_clusters - 1))[-(nb_clusters - 1):] + 1)
+
+    for _ in range(nb_iterations):
+        sums = np.add.reduceat(sorted_values, np.r_[0, splits])
+        counts = np.diff(np.r_[0, splits, len(sorted_values)])
+        centers = sums / counts
+
+        boundaries = (centers[:-1] + centers[1:]) / 2
+        new_splits = np.searchsorted(sorted_values, boundaries, side='right')
+        # A cluster can't get empty.
+        if np.any(np.diff(np.r_[0, new_splits, len(sorted_values)]) == 0):
+            break
+        if np.array_equal(new_splits, splits):
+            break
+        splits = new_splits
+
+    labels = np.empty(len(values), dtype=int)
+    labels[order] = np.repeat(np.arange(nb_clusters), np.diff(np.r_[0, splits, len(sorted_values)]))
+    return labels
+
+
+def fit_lines(params, positions, nb_lines=4):
+    """Average the (slope, intercept) of the segments of each of the nb_lines lines."""
+    labels = cluster_1d(positions, nb_lines)
+    counts = np.bincount(labels, minlength=nb_lines)
+
+    return np.stack([
+        np.bincount(labels, weights=params[:, i], minlength=nb_lines) / counts
+        for i in range(2)
+    ], axis=1)
 
 
 def find_board(board_img):
+    """Find the 4 vertical and 4 horizontal lines of the board grid.
+
+    Horizontal lines are returned as (a, b) with y = a * x + b and vertical
+    ones as (c, d) with x = c * y + d (so they can be exactly vertical),
+    both sorted by position.
+    """
+    import cv2 as cv
+
     edges = cv.Canny(cv.cvtColor(board_img, cv.COLOR_BGR2GRAY), 210, 256)
 
     rho = 1  # distance resolution in pixels of the Hough grid
@@ -18,86 +72,66 @@ def find_board(board_img):
     # Output "lines" is an array containing endpoints of detected line segments
     lines = cv.HoughLinesP(edges, rho, theta, threshold, np.array([]),
                            min_line_length, max_line_gap)
+    if lines is None:
+        raise ValueError('No line found')
 
-    horizontal, vertical = [], []
-    for line in lines:
-        for x1, y1, x2, y2 in line:
-            a = (y2 - y1) / (x2 - x1)
-            b = y1 - a * x1
-
-            if np.abs(a) < 0.1:
-                horizontal.append((a, b))
-            elif np.abs(a) > 2:
-                vertical.append((a, b))
+    x1, y1, x2, y2 = lines.reshape(-1, 4).astype(np.float64).T
+    dx, dy = x2 - x1, y2 - y1
 
-    vertical = np.array(vertical)
-    V = np.array([(200 - b) / a for a, b in vertical]).reshape(-1, 1)
-    kmeans = KMeans(n_clusters=4, random_state=0).fit(V)
-    vertical = np.array(
-        [vertical[np.where(kmeans.labels_ == i)[0]].mean(axis=0)
-         for i in range(4)])
+    # |slope| < 0.1 and |slope| > 2, without dividing by dx.
+    horizontal = np.abs(dy) < 0.1 * np.abs(dx)
+    vertical = np.abs(dy) > 2 * np.abs(dx)
 
-    horizontal = np.array(horizontal)
-    H = np.array([200 * a + b for a, b in horizontal]).reshape(-1, 1)
-    kmeans = KMeans(n_clusters=4, random_state=0).fit(H)
-    horizontal = np.array(
-        [horizontal[np.where(kmeans.labels_ == i)[0]].mean(axis=0)
-         for i in range(4)])
+    a = dy[horizontal] / dx[horizontal]
+    b = y1[horizontal] - a * x1[horizontal]
+    horizontal = fit_lines(np.stack((a, b), axis=1), 200 * a + b)
 
-    V = np.array([(200 - b) / a for a, b in vertical])
-    vertical = vertical[V.argsort()]
+    c = dx[vertical] / dy[vertical]
+    d = x1[vertical] - c * y1[vertical]
+    vertical = fit_lines(np.stack((c, d), axis=1), 200 * c + d)
 
-    H = np.array([200 * a + b for a, b in horizontal])
-    horizontal = horizontal[H.argsort()]
-
-    return vertical.tolist(), horizontal.tolist()
+    return vertical, horizontal
 
 
 def find_board_corners(board_img):
-    v, h = find_board(board_img)
+    """Intersections of the grid lines, as corners[h, v] = (x, y)."""
+    vertical, horizontal = find_board(board_img)
 
-    corners = []
+    c, d = vertical[np.newaxis, :, 0], vertical[np.newaxis, :, 1]
+    a, b = horizontal[:, np.newaxis, 0], horizontal[:, np.newaxis, 1]
 
-    for a1, b1 in v:
-        for a2, b2 in h:
-            x = (b2 - b1) / (a1 - a2)
-            y = a1 * x + b1
-            corners.append((x, y))
+    # x = c * y + d and y = a * x + b
+    x = (c * b + d) / (1 - c * a)
+    y = a * x + b
 
-    return np.array(corners, dtype=np.int)
+    return np.stack((x, y), axis=-1).astype(int)
 
 
 def find_board_cases(board_img):
-    corners = find_board_corners(board_img)
-    (A, E, I, M,
-     B, F, J, N,
-     C, G, K, O,
-     D, H, L, P) = corners
+    return corners_to_cases(find_board_corners(board_img))
 
-    board_cases = np.array((
-        ((E[0], F[0], B[1], F[1]),
-         (F[0], G[0], C[1], G[1]),
-         (G[0], H[0], D[1], H[1]),),
 
-        ((I[0], J[0], F[1], J[1]),
-         (J[0], K[0], G[1], K[1]),
-         (K[0], L[0], H[1], L[1]),),
+def corners_to_cases(corners):
+    x, y = corners[..., 0], corners[..., 1]
 
-        ((M[0], N[0], J[1], N[1]),
-         (N[0], O[0], K[1], O[1]),
-         (O[0], P[0], L[1], P[1]), ),
-    ), dtype=np.int)
+    # Case (row, col) goes from the vertical line col to col + 1 and from
+    # the horizontal line row to row + 1 (left, right, top, bottom).
+    return np.stack((
+        x[1:, :-1],
+        x[1:, 1:],
+        y[:-1, 1:],
+        y[1:, 1:],
+    ), axis=-1)
 
-    return board_cases
 
+# Part of the camera frame where the board is looked for.
+search_rect = (275, 710, 325, 700)  # left, right, top, bottom
 
-def get_board_cases(img):
-    ly, ry, lx, rx = 325, 700, 275, 710
-    img = img[ly:ry, lx:rx, :]
 
-    cases = find_board_cases(img)
-    for row in range(3):
-        for col in range(3):
-            cases[row, col] += (lx, lx, ly, ly)
+def get_board_corners(img):
+    lx, rx, ly, ry = search_rect
+    return find_board_corners(img[ly:ry, lx:rx, :]) + (lx, ly)
 
-    return cases
+
+def get_board_cases(img):
+    return corners_to_cases(get_board_corners(img))
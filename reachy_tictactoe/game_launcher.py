@@ -1,9 +1,4 @@
 import logging
-import numpy as np
-
-import zzlog
-
-from . import TictactoePlayground
 
 logger = logging.getLogger('reachy.tictactoe')
 
@@ -31,7 +26,7 @@ def run_game_loop(tictactoe_playground):
  #           logger.info("No one to play with apparently, Reachy goes into sleep mode.")
  #           tictactoe_playground.enter_sleep_mode()
 
-        tictactoe_playground.run_random_idle_behavior()
+        tictactoe_playground.run_random_idle_behavior(board)
 
     last_board = tictactoe_playground.reset()
 
@@ -61,19 +56,14 @@ def run_game_loop(tictactoe_playground):
                     'next_player': 'Reachy',
                 })
             else:
-                tictactoe_playground.run_random_idle_behavior()
+                tictactoe_playground.run_random_idle_behavior(last_board)
 
         # If we have detected some cheating or any issue
         # We reset the whole game
+        # (the board is filtered over several frames, so there is no need
+        # to check it again to rule out a misclassified frame)
         if (tictactoe_playground.incoherent_board_detected(board) or
                 tictactoe_playground.cheating_detected(board, last_board, reachy_turn)):
-            # Check again to be sure
-            double_check_board = tictactoe_playground.analyze_board()
-            if np.any(double_check_board != board):
-                # False detection, we will check again next loop
-                continue
-
-            # We're pretty sure somthing weird happened!
             tictactoe_playground.shuffle_board()
             break
 
@@ -112,8 +102,14 @@ if __name__ == '__main__':
     from datetime import datetime
     from glob import glob
 
+    import zzlog
+
+    from .inference import backends
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--log-file')
+    parser.add_argument('--backend', choices=backends, default=None)
+    parser.add_argument('--num-threads', type=int, default=None)
     args = parser.parse_args()
 
     if args.log_file is not None:
@@ -131,25 +127,51 @@ if __name__ == '__main__':
         'Creating a Tic Tac Toe playground.'
     )
 
+    # Heavy imports (Reachy SDK, models, moves) only happen from here on.
+    from . import vision
+    from . import TictactoePlayground
+
+    vision.configure(backend_name=args.backend, nb_threads=args.num_threads)
+
+    from .timing import Profiler, profiler
+
+    # Spans are reported for every game, and for the whole session on exit.
+    session_profiler = Profiler()
+
     with TictactoePlayground() as tictactoe_playground:
         tictactoe_playground.setup()
 
         game_played = 0
 
-        while True:
-            winner = run_game_loop(tictactoe_playground)
-            game_played += 1
+        try:
+            while True:
+                winner = run_game_loop(tictactoe_playground)
+                game_played += 1
+                logger.info(
+                    'Game ended',
+                    extra={
+                        'game_number': game_played,
+                        'winner': winner,
+                        'idle': tictactoe_playground.clock.idle_report(),
+                        'timings': profiler.report(),
+                    }
+                )
+                tictactoe_playground.clock.reset_accounting()
+                session_profiler.extend(profiler)
+                profiler.reset()
+
+                if tictactoe_playground.need_cooldown():
+                    logger.warning('Reachy needs cooldown')
+                    tictactoe_playground.enter_sleep_mode()
+                    tictactoe_playground.wait_for_cooldown()
+                    tictactoe_playground.leave_sleep_mode()
+                    logger.info('Reachy cooldown finished')
+        finally:
+            session_profiler.extend(profiler)
             logger.info(
-                'Game ended',
+                'Session timings',
                 extra={
-                    'game_number': game_played,
-                    'winner': winner,
+                    'games_played': game_played,
+                    'timings': session_profiler.report(),
                 }
             )
-
-            if tictactoe_playground.need_cooldown():
-                logger.warning('Reachy needs cooldown')
-                tictactoe_playground.enter_sleep_mode()
-                tictactoe_playground.wait_for_cooldown()
-                tictactoe_playground.leave_sleep_mode()
-                logger.info('Reachy cooldown finished')
@@ -0,0 +1,221 @@
+import logging
+import os
+import time
+
+import numpy as np
+
+
+logger = logging.getLogger('reachy.tictactoe')
+
+
+def read_label_file(path):
+    labels = {}
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            index, label = line.split(maxsplit=1)
+            labels[int(index)] = label
+
+    return labels
+
+
+class InferenceBackend(object):
+    """Image classifier taking a single HxWx3 RGB uint8 tensor.
+
+    Subclasses implement `_classify` (and `_run` for models with several
+    outputs) and set `input_shape` to the (height, width) expected by the
+    model. Every call is timed and the latency is kept on the backend so
+    callers can log or aggregate it.
+    """
+
+    name = None
+
+    def __init__(self, input_shape):
+        self.input_shape = tuple(int(d) for d in input_shape)
+
+        self.last_latency = None
+        self.total_latency = 0.0
+        self.nb_calls = 0
+
+    def classify(self, input_tensor):
+        label, score = self._timed(self._classify, input_tensor)
+        return int(label), float(score)
+
+    def run(self, input_tensor):
+        """Scores of every output of the model, as a list of float arrays."""
+        return self._timed(self._run, input_tensor)
+
+    def _timed(self, f, input_tensor):
+        start = time.perf_counter()
+        result = f(input_tensor)
+        self.last_latency = time.perf_counter() - start
+
+        self.total_latency += self.last_latency
+        self.nb_calls += 1
+
+        return result
+
+    def _classify(self, input_tensor):
+        raise NotImplementedError
+
+    def _run(self, input_tensor):
+        raise NotImplementedError
+
+    @property
+    def mean_latency(self):
+        if self.nb_calls == 0:
+            return None
+        return self.total_latency / self.nb_calls
+
+
+class EdgeTPUBackend(InferenceBackend):
+    name = 'edgetpu'
+
+    def __init__(self, model_path, multi_output=False):
+        # The classification engine only accepts models with a single output.
+        if multi_output:
+            from edgetpu.basic.basic_engine import BasicEngine as Engine
+        else:
+            from edgetpu.classification.engine import ClassificationEngine as Engine
+
+        self.engine = Engine(model_path)
+        _, height, width, _ = self.engine.get_input_tensor_shape()
+
+        InferenceBackend.__init__(self, (height, width))
+
+    def _classify(self, input_tensor):
+        res = self.engine.classify_with_input_tensor(input_tensor.reshape(-1), top_k=1)
+        assert res
+
+        return res[0]
+
+    def _run(self, input_tensor):
+        _, outputs = self.engine.run_inference(input_tensor.reshape(-1))
+        sizes = self.engine.get_all_output_tensors_sizes()
+
+        return np.split(outputs, np.cumsum(sizes)[:-1])
+
+
+class TFLiteBackend(InferenceBackend):
+    name = 'tflite'
+
+    def __init__(self, model_path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        # The XNNPACK delegate is applied by default by recent tflite
+        # runtimes, num_threads sets the size of its thread pool.
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+
+        input_details = self.interpreter.get_input_details()[0]
+
+        self._input_index = input_details['index']
+        self._input_dtype = input_details['dtype']
+        self._output_details = self.interpreter.get_output_details()
+
+        _, height, width, _ = input_details['shape']
+
+        InferenceBackend.__init__(self, (height, width))
+
+    def _classify(self, input_tensor):
+        scores = self._run(input_tensor)[0]
+        label = np.argmax(scores)
+
+        return label, scores[label]
+
+    def _run(self, input_tensor):
+        if self._input_dtype == np.uint8:
+            # Inputs may be strided views (e.g. the cells of the rectified board).
+            input_tensor = np.ascontiguousarray(input_tensor[np.newaxis])
+        else:
+            input_tensor = input_tensor[np.newaxis].astype(self._input_dtype) / 255.0
+
+        self.interpreter.set_tensor(self._input_index, input_tensor)
+        self.interpreter.invoke()
+
+        outputs = []
+        for details in self._output_details:
+            scores = self.interpreter.get_tensor(details['index'])[0]
+            scale, zero_point = details['quantization']
+            if scale:
+                scores = scale * (scores.astype(np.float32) - zero_point)
+            outputs.append(scores)
+
+        return outputs
+
+
+class FakeBackend(InferenceBackend):
+    """Deterministic classifier used for tests and benchmarks.
+
+    Without a `predict` function, the mean intensity of the input is split
+    into `nb_labels` equal bands, so uniform patches painted with the
+    middle of a band are always classified as that band's label. Without a
+    `run` function, the model has a single output, the one-hot scores of
+    that label.
+    """
+
+    name = 'fake'
+
+    def __init__(self, nb_labels, input_shape=(224, 224), predict=None, run=None):
+        InferenceBackend.__init__(self, input_shape)
+
+        self.nb_labels = nb_labels
+        self.predict = predict
+        self.run_outputs = run
+
+    def _classify(self, input_tensor):
+        if self.predict is not None:
+            return self.predict(input_tensor)
+
+        return self.band(input_tensor), 1.0
+
+    def _run(self, input_tensor):
+        if self.run_outputs is not None:
+            return self.run_outputs(input_tensor)
+
+        label, score = self._classify(input_tensor)
+        scores = np.zeros(self.nb_labels, dtype=np.float32)
+        scores[label] = score
+        return [scores]
+
+    def band(self, img):
+        return min(int(img.mean()) * self.nb_labels // 256, self.nb_labels - 1)
+
+
+backends = ('auto', 'edgetpu', 'tflite', 'fake')
+
+
+def cpu_model_path(model_path):
+    # Edge TPU compiled models can't run on the CPU interpreter, use the
+    # uncompiled model saved next to it when there is one.
+    root, ext = os.path.splitext(model_path)
+    cpu_path = f'{root}_cpu{ext}'
+
+    return cpu_path if os.path.exists(cpu_path) else model_path
+
+
+def load_backend(model_path, backend='auto', nb_labels=None, num_threads=None, multi_output=False):
+    if backend not in backends:
+        raise ValueError(f'Unknown inference backend "{backend}", should be one of {backends}.')
+
+    if backend == 'fake':
+        return FakeBackend(nb_labels)
+
+    if backend in ('auto', 'edgetpu'):
+        try:
+            return EdgeTPUBackend(model_path, multi_output=multi_output)
+        except (ImportError, RuntimeError, ValueError) as e:
+            if backend == 'edgetpu':
+                raise
+            logger.warning('Edge TPU unavailable, falling back to CPU inference', extra={
+                'model': model_path,
+                'error': e,
+            })
+
+    return TFLiteBackend(cpu_model_path(model_path), num_threads=num_threads)
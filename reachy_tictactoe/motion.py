@@ -0,0 +1,361 @@
+import logging
+import os
+
+import numpy as np
+
+from collections.abc import Mapping
+from glob import glob
+
+from .packed import load_arrays, save_arrays
+
+
+logger = logging.getLogger('reachy.tictactoe.motion')
+
+
+class Move(Mapping):
+    """A recorded move, as a read-only mapping of joint names to positions.
+
+    A position move maps every joint to its goal position (a 0-d array), a
+    trajectory move to the 1-D array of its samples, taken every 1 / freq
+    second (see time). Both are views into the library data, so they can be
+    given as is to reachy.goto and TrajectoryPlayer.
+
+    The start and end poses ({joint: position}, the same for a position
+    move) and the duration are computed once, when the move is loaded.
+    """
+
+    def __init__(self, name, joints, positions, is_trajectory, time, freq):
+        self.name = name
+        self.joints = tuple(joints)
+        # (nb_joints, nb_samples), with a single sample for a position.
+        self.positions = positions
+        self.is_trajectory = is_trajectory
+        self.time = time
+
+        self.start = dict(zip(self.joints, positions[:, 0].tolist()))
+        self.end = dict(zip(self.joints, positions[:, -1].tolist()))
+        self.duration = positions.shape[1] / freq if is_trajectory else 0.0
+
+        self._index = {joint: i for i, joint in enumerate(self.joints)}
+
+    def __getitem__(self, joint):
+        positions = self.positions[self._index[joint]]
+        return positions if self.is_trajectory else positions.reshape(())
+
+    def __iter__(self):
+        return iter(self.joints)
+
+    def __len__(self):
+        return len(self.joints)
+
+    def __repr__(self):
+        kind = 'trajectory' if self.is_trajectory else 'position'
+        return f'<Move {self.name} ({kind}, {len(self.joints)} joints, {self.positions.shape[1]} samples)>'
+
+
+class MotionLibrary(Mapping):
+    """Read-only mapping of the recorded moves by name.
+
+    Every move is loaded at once, the first time the library is used, into
+    a single contiguous float32 array, so playing a move never reads the
+    disk. joints lists every joint used by a move and time is the time base
+    shared by the trajectories.
+
+    The moves are read from the packed file (see save) when there is one,
+    which is memory-mapped, from the .npz files of path otherwise.
+    """
+
+    def __init__(self, path=None, packed_path=None, freq=100):
+        self.path = path
+        self.packed_path = packed_path
+        self.freq = freq
+        self._moves = None
+
+    @classmethod
+    def from_moves(cls, moves, freq=100):
+        """Library of moves given as {name: {joint: position(s)}}."""
+        library = cls(freq=freq)
+        library._open(*pack(moves), freq)
+        return library
+
+    def load(self):
+        if self._moves is None:
+            if self.packed_path is not None and os.path.exists(self.packed_path):
+                arrays, meta = load_arrays(self.packed_path, mmap=True)
+                self._open(arrays['data'], meta['moves'], meta['freq'])
+            else:
+                self._open(*pack(read_moves(self.path)), self.freq)
+        return self
+
+    def save(self, path):
+        """Pack every move in a single file, see packed.save_arrays.
+
+        The header indexes every move by name with its offset in the data,
+        joints, number of samples and type, and the sample rate.
+        """
+        self.load()
+        save_arrays(path, {'data': self.data}, meta={
+            'freq': self.freq,
+            'moves': self.index,
+        })
+
+    def _open(self, data, index, freq):
+        self.data = data
+        self.index = index
+        self.freq = freq
+
+        self.joints = tuple(dict.fromkeys(joint for move in index.values() for joint in move['joints']))
+        self.joint_index = {joint: i for i, joint in enumerate(self.joints)}
+
+        max_samples = max((move['nb_samples'] for move in index.values() if move['trajectory']), default=0)
+        self.time = np.arange(max_samples, dtype=np.float32) / freq
+
+        # The moves are views taken once the data is read-only, so they are too.
+        self.data.flags.writeable = False
+        self.time.flags.writeable = False
+
+        self._moves = {}
+        for name, move in index.items():
+            nb_joints, nb_samples = len(move['joints']), move['nb_samples']
+            offset = move['offset']
+
+            positions = self.data[offset:offset + nb_joints * nb_samples].reshape(nb_joints, nb_samples)
+            self._moves[name] = Move(
+                name, move['joints'], positions, move['trajectory'], self.time[:nb_samples], freq,
+            )
+
+    def __getitem__(self, name):
+        return self.load()._moves[name]
+
+    def __iter__(self):
+        return iter(self.load()._moves)
+
+    def __len__(self):
+        return len(self.load()._moves)
+
+
+def read_moves(path):
+    """Read the moves of the .npz files of path, as {name: {joint: position(s)}}."""
+    moves = {}
+
+    for move_path in sorted(glob(os.path.join(path, '*.npz'))):
+        name = os.path.splitext(os.path.basename(move_path))[0]
+
+        # Unreadable files (e.g. git-lfs pointers) are errors, files
+        # which aren't joint positions are not moves.
+        with np.load(move_path) as f:
+            try:
+                move = {joint: f[joint] for joint in f.files}
+            except ValueError:
+                logger.warning('Skipping a file which is not a move', extra={'path': move_path})
+                continue
+        moves[name] = move
+
+    return moves
+
+
+def pack(moves):
+    """Concatenate the moves into a single float32 array, returns it with its index.
+
+    Every move is stored as (nb_joints, nb_samples) at index[name]['offset'].
+    """
+    index = {}
+    offset = 0
+    for name, move in moves.items():
+        nb_samples = {np.size(positions) for positions in move.values()}
+        if len(nb_samples) != 1 or any(np.ndim(positions) > 1 for positions in move.values()):
+            raise ValueError(f'The joints of move "{name}" don\'t have the same number of samples')
+
+        index[name] = {
+            'offset': offset,
+            'joints': list(move),
+            'nb_samples': nb_samples.pop(),
+            'trajectory': bool(np.ndim(next(iter(move.values()))) == 1),
+        }
+        offset += len(move) * index[name]['nb_samples']
+
+    data = np.empty(offset, dtype=np.float32)
+    for name, move in moves.items():
+        nb_joints, nb_samples = len(move), index[name]['nb_samples']
+        offset = index[name]['offset']
+
+        positions = data[offset:offset + nb_joints * nb_samples].reshape(nb_joints, nb_samples)
+        for i, joint in enumerate(move):
+            positions[i] = move[joint]
+
+    return data, index
+
+
+def min_jerk(p0, p1, v0, v1, duration, t):
+    """Positions and velocities at times t of the quintic going from p0 at
+    speed v0 to p1 at speed v1 in duration, with zero accelerations at both
+    ends (the minimum jerk move when v0 and v1 are 0).
+
+    p0, p1, v0 and v1 are (nb_joints, ) arrays, the results (nb_joints, len(t)).
+    """
+    s = np.asarray(t, dtype=np.float64)[np.newaxis] / duration
+    p0, p1, v0, v1 = (np.asarray(x, dtype=np.float64)[:, np.newaxis] for x in (p0, p1, v0, v1))
+
+    h01 = s ** 3 * (10 - 15 * s + 6 * s ** 2)
+    h10 = s - s ** 3 * (6 - 8 * s + 3 * s ** 2)
+    h11 = -s ** 3 * (4 - 7 * s + 3 * s ** 2)
+    dh01 = 30 * s ** 2 * (1 - s) ** 2
+    dh10 = 1 - s ** 2 * (18 - 32 * s + 15 * s ** 2)
+    dh11 = -s ** 2 * (12 - 28 * s + 15 * s ** 2)
+
+    positions = p0 + (p1 - p0) * h01 + duration * (v0 * h10 + v1 * h11)
+    velocities = (p1 - p0) * dh01 / duration + v0 * dh10 + v1 * dh11
+
+    return positions, velocities
+
+
+def shortest_duration(p0, p1, v0, v1, duration, resolution=0.01):
+    """Shortest duration of the (p0, v0) -> (p1, v1) quintic whose joint
+    speeds stay under the peak speeds of the rest to rest minimum jerk move
+    of the given duration, which is the longest it can take.
+
+    The durations are multiples of resolution (e.g. the sample period of
+    the trajectory), all of them are tried at once.
+    """
+    # The rest to rest minimum jerk move peaks at 1.875 times its mean speed,
+    # a move at constant speed can't be shorter than that.
+    max_speeds = 1.875 * np.abs(np.asarray(p1) - np.asarray(p0)) / duration + 1e-6
+    s = np.linspace(0, 1, 33)
+
+    # At s = t / d, the speeds of the quintic of duration d are the ones of
+    # the rest to rest move of duration 1 divided by d, plus the ones due to
+    # the passing speeds, which don't depend on d.
+    zeros = np.zeros(len(max_speeds))
+    _, rest_speeds = min_jerk(p0, p1, zeros, zeros, 1, s)
+    _, passing_speeds = min_jerk(zeros, zeros, v0, v1, 1, s)
+
+    durations = np.append(np.arange(np.ceil(duration / 1.875 / resolution), duration / resolution) * resolution, duration)
+    speeds = rest_speeds[:, np.newaxis] / durations[:, np.newaxis] + passing_speeds[:, np.newaxis]
+    within_limits = np.all(np.abs(speeds) <= max_speeds[:, np.newaxis, np.newaxis], axis=(0, 2))
+
+    # The shortest duration all the longer ones are within the limits from.
+    too_fast = np.flatnonzero(~within_limits)
+    if len(too_fast) == 0:
+        return float(durations[0])
+    if too_fast[-1] == len(durations) - 1:
+        logger.debug('Passing speeds too fast for the segment, keeping its duration', extra={
+            'duration': duration,
+        })
+        return duration
+    return float(durations[too_fast[-1] + 1])
+
+
+def blend_waypoints(start, waypoints, freq=100, nb_iterations=5):
+    """One continuous trajectory from start through the waypoints.
+
+    Every waypoint is a (pose, duration) pair, where duration is the one of
+    the rest to rest goto it replaces. A pose is a {joint: position}
+    mapping (a position Move for instance) or a trajectory Move, which is
+    reached in duration then played. Joints missing from a pose keep their
+    position.
+
+    The arm only stops at the start and the end: it goes through the
+    intermediate poses at the slowest of the mean speeds of the segments
+    around them (or stops there when a joint reverses), and enters and
+    leaves the trajectories at their own speed, up to the one of the goto. As it doesn't stop,
+    every segment is shortened as long as no joint goes faster than during
+    the goto it replaces. Returns {joint: positions} sampled at freq, to be
+    played with TrajectoryPlayer.
+    """
+    joints = list(dict.fromkeys(joint for pose, _ in waypoints for joint in pose))
+    current = np.array([start[joint] for joint in joints], dtype=np.float64)
+
+    # Segments are gotos (start, target, duration) or trajectories to play
+    # (samples, None).
+    segments = []
+    for pose, duration in waypoints:
+        trajectory = isinstance(pose, Move) and pose.is_trajectory
+
+        target = current.copy()
+        for i, joint in enumerate(joints):
+            if joint in pose:
+                target[i] = pose.start[joint] if trajectory else float(pose[joint])
+        segments.append((current, target, duration))
+        current = target
+
+        if trajectory:
+            samples = np.repeat(current[:, np.newaxis], len(pose.time), axis=1)
+            for i, joint in enumerate(joints):
+                if joint in pose:
+                    samples[i] = pose[joint]
+            segments.append((samples, None))
+            current = samples[:, -1]
+
+    gotos = [i for i, segment in enumerate(segments) if len(segment) == 3]
+    durations = {i: segments[i][2] for i in gotos}
+
+    def mean_speed(i):
+        p0, p1, _ = segments[i]
+        return (p1 - p0) / durations[i]
+
+    def edge_speed(i, end):
+        # Speed at the start (or end) of the trajectory segment i.
+        samples = segments[i][0]
+        if samples.shape[1] < 2:
+            return np.zeros(len(joints))
+        return (samples[:, -1] - samples[:, -2] if end else samples[:, 1] - samples[:, 0]) * freq
+
+    def toward(speed, i):
+        # The speed for the joints it moves in the direction of the goto i,
+        # up to its mean speed, 0 for the others.
+        mean = mean_speed(i)
+        same_direction = np.sign(speed) * np.sign(mean) > 0
+        return np.where(same_direction, np.sign(mean) * np.minimum(np.abs(speed), np.abs(mean)), 0)
+
+    def passing_speed(i, j):
+        # Speed between the consecutive segments i and j, one of them a goto.
+        if i < 0 or j >= len(segments):
+            return np.zeros(len(joints))
+        if i not in durations:
+            return toward(edge_speed(i, end=True), j)
+        if j not in durations:
+            return toward(edge_speed(j, end=False), i)
+        return toward(mean_speed(i), j)
+
+    def velocities(i):
+        return passing_speed(i - 1, i), passing_speed(i, i + 1)
+
+    # Shorter segments make faster passing speeds, which in turn limit how
+    # much the segments can be shortened, so this is iterated a few times.
+    for _ in range(nb_iterations):
+        durations = {
+            i: shortest_duration(segments[i][0], segments[i][1], *velocities(i), segments[i][2], resolution=1 / freq)
+            for i in gotos
+        }
+
+    trajectory = []
+    for i, segment in enumerate(segments):
+        if i not in durations:
+            trajectory.append(segment[0])
+            continue
+
+        nb_samples = max(int(round(durations[i] * freq)), 1)
+        p0, p1, _ = segment
+        v0, v1 = velocities(i)
+        positions, _ = min_jerk(p0, p1, v0, v1, nb_samples / freq, np.arange(1, nb_samples + 1) / freq)
+        trajectory.append(positions)
+
+    trajectory = np.concatenate(trajectory, axis=1).astype(np.float32)
+    return dict(zip(joints, trajectory))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from .moves import dir_path, packed_path
+
+    parser = argparse.ArgumentParser(description='Pack the recorded moves in a single file.')
+    parser.add_argument('--input', default=dir_path)
+    parser.add_argument('--output', default=packed_path)
+    args = parser.parse_args()
+
+    library = MotionLibrary(args.input)
+    library.save(args.output)
+
+    print(f'Saved {len(library)} moves ({len(library.joints)} joints) '
+          f'to {args.output} ({os.path.getsize(args.output)} bytes).')
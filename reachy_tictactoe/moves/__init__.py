@@ -1,20 +1,14 @@
 import os
-import numpy as np
 
-from glob import glob
+from ..motion import MotionLibrary
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
+# Built from the .npz files with python -m reachy_tictactoe.motion
+packed_path = os.path.join(dir_path, 'moves.pack')
 
 
-names = [
-    os.path.splitext(os.path.basename(f))[0]
-    for f in glob(os.path.join(dir_path, '*.npz'))
-]
-
-moves = {
-    name: np.load(os.path.join(dir_path, f'{name}.npz'))
-    for name in names
-}
+# Loaded on first use, see MotionLibrary.
+moves = MotionLibrary(dir_path, packed_path)
 
 '''
 rest_pos = {
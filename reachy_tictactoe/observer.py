@@ -0,0 +1,177 @@
+import logging
+
+import numpy as np
+
+from collections import namedtuple
+from threading import Condition, Event, Thread
+
+from . import vision
+from .board_filter import BoardFilter
+from .change_detector import ChangeDetector
+from .clock import default_clock
+from .timing import timed
+
+
+logger = logging.getLogger('reachy.tictactoe.observer')
+
+
+# board is None when the board was not seen as valid. cells and scores are
+# the raw classification of every box (see vision.get_board_cells), board
+# and confidence the flattened state of the board filtered over the frames.
+Observation = namedtuple('Observation', (
+    'valid', 'board', 'confidence', 'stable', 'cells', 'scores', 'img', 'timestamp', 'index',
+))
+
+
+class BoardObserver(object):
+    """Analyzes the camera frames in a background thread.
+
+    The latest observation of the board is always available, so the game
+    loop doesn't have to wait for the capture and the classifications,
+    and can even notice the human has played while the robot is moving.
+    """
+
+    def __init__(self, camera, clock=default_clock, board_filter=None, calibrator=None):
+        self.camera = camera
+        self.clock = clock
+        self.filter = board_filter if board_filter is not None else BoardFilter()
+        # Without calibrator, the fixed vision.board_cases are used.
+        self.calibrator = calibrator
+        self.change_detector = ChangeDetector(self.board_cases)
+
+        # Latest classification of every box, only updated for the boxes
+        # which changed.
+        self.cells = np.zeros(9, dtype=np.uint8)
+        self.scores = np.zeros(9)
+
+        self.latest = None
+
+        self._new_observation = Condition()
+        self._running = Event()
+        self._t = None
+
+    def start(self):
+        if self._t is not None:
+            return
+
+        logger.info('Starting the board observer')
+        self._running.set()
+        self._t = Thread(target=self._observe, daemon=True)
+        self._t.start()
+
+    def stop(self):
+        if self._t is None:
+            return
+
+        logger.info('Stopping the board observer')
+        self._running.clear()
+        self._t.join()
+        self._t = None
+
+    def _observe(self):
+        index = None
+
+        while self._running.is_set():
+            frame = self.camera.get_latest(after=index, timeout=0.5, reason=None)
+            if frame is None:
+                continue
+            index = frame.index
+
+            try:
+                observation = self.analyze(frame)
+            except Exception:
+                logger.exception('Board analysis failed')
+                continue
+
+            with self._new_observation:
+                self.latest = observation
+                self._new_observation.notify_all()
+
+    @property
+    def board_cases(self):
+        if self.calibrator is None:
+            return None
+        return self.calibrator.board_cases
+
+    @property
+    def homography(self):
+        if self.calibrator is None:
+            return None
+        return self.calibrator.homography
+
+    @timed('observer.analyze')
+    def analyze(self, frame):
+        changed, thumbnails = self.change_detector.changed(frame.img)
+        boxes = np.where(changed)[0]
+
+        # The board is rectified and read at most once per frame, and only
+        # when needed.
+        board_img, reading = [], []
+
+        def read():
+            if not reading:
+                board_img.append(vision.warp_board(frame.img, self.homography))
+                reading.append(vision.read_board(board_img[0], boxes))
+            return reading[0]
+
+        if self.calibrator is not None and self.calibrator.update(frame.img, lambda: read()[0]):
+            # All the boxes are read again with the new geometry.
+            self.change_detector = ChangeDetector(self.board_cases)
+            changed, thumbnails = self.change_detector.changed(frame.img)
+            boxes = np.where(changed)[0]
+            board_img.clear()
+            reading.clear()
+
+        # If nothing moved, the board is still the one last classified,
+        # which was valid. Invalid frames (e.g. a hand over the board) are
+        # neither classified nor filtered, and the boxes they changed are
+        # checked again on the next frames.
+        if len(boxes) > 0:
+            valid, cells, scores = read()
+            if not valid:
+                return Observation(
+                    False, None, None, False, None, None,
+                    frame.img, frame.timestamp, frame.index,
+                )
+
+            self.cells[boxes] = cells.flat[boxes]
+            self.scores[boxes] = scores.flat[boxes]
+        self.change_detector.update(thumbnails, boxes)
+
+        board, confidence = self.filter.update(self.cells, self.scores)
+
+        return Observation(
+            True, board, confidence, self.filter.stable, self.cells.copy(), self.scores.copy(),
+            frame.img, frame.timestamp, frame.index,
+        )
+
+    def get_latest(self, min_timestamp=None, stable=False, timeout=0, reason='wait_for_board'):
+        """Latest observation of a frame captured at or after min_timestamp.
+
+        With stable, the observation must also be a valid board whose
+        filtered state is settled. Waits up to timeout for it, returns
+        None if there is none.
+        """
+        if min_timestamp is None:
+            min_timestamp = -np.inf
+
+        def fresh():
+            observation = self.latest
+            return (
+                observation is not None and observation.timestamp >= min_timestamp and
+                (observation.stable or not stable)
+            )
+
+        if not fresh() and not self.clock.wait_for(
+                self._new_observation, fresh, timeout=timeout, reason=reason):
+            return None
+
+        return self.latest
+
+    def board_changed(self, board):
+        """Whether the latest stable observation differs from board."""
+        observation = self.latest
+        return (
+            observation is not None and observation.stable and
+            np.any(observation.board != board)
+        )
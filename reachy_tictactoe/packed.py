@@ -0,0 +1,82 @@
+import json
+import os
+
+import numpy as np
+
+
+# File layout: magic, little-endian uint64 header length, JSON header, then
+# every array's raw bytes, each starting on an ALIGNMENT boundary.
+MAGIC = b'RTTPACK\x01'
+ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_arrays(path, arrays, meta=None):
+    """Write named arrays and JSON metadata into a single file.
+
+    The file is written next to `path` and then renamed over it, so readers
+    always see either the old or the new content.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    index = {}
+    offset = 0
+    for name, array in arrays.items():
+        index[name] = {
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'offset': offset,
+        }
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({'arrays': index, 'meta': meta or {}}).encode()
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array(len(header), dtype='<u8').tobytes())
+        f.write(header)
+
+        for name, array in arrays.items():
+            f.seek(data_start + index[name]['offset'])
+            array.tofile(f)
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path, mmap=True):
+    """Load a file written by save_arrays, returns (arrays, meta).
+
+    With mmap, the file is mapped read-only once and every array is a
+    zero-copy view into it.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a packed array file.')
+        header_len = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(header_len).decode())
+
+    data_start = _align(len(MAGIC) + 8 + header_len)
+
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+
+    arrays = {}
+    for name, info in header['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        start = data_start + info['offset']
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+
+        arrays[name] = buffer[start:start + nbytes].view(dtype).reshape(shape)
+
+    return arrays, header['meta']
@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+
+from .board import NB_CODES, reachable_codes
+from .packed import load_arrays, save_arrays
+
+
+dir_path = os.path.dirname(os.path.realpath(__file__))
+
+npz_path = os.path.join(dir_path, 'Q-value.npz')
+compact_path = os.path.join(dir_path, 'Q-value.pack')
+
+# Q-tables are stored for player 1 (QX) and player 2 (QO).
+table_names = {1: 'QX', 2: 'QO'}
+
+
+class DenseQTable(object):
+    """Q-values for all the 3^9 boards, indexed by their base-3 code."""
+
+    def __init__(self, values):
+        self.values = values.reshape(-1)
+
+    def lookup(self, codes):
+        return self.values[codes].astype(np.float64)
+
+
+class CompactQTable(object):
+    """Q-values of the reachable boards only, possibly quantized.
+
+    `slots` maps every base-3 code to its row in `values`, or -1 for the
+    unreachable boards, whose value is 0 (they are never updated during
+    training). Quantized values are mapped back to floats on lookup.
+    """
+
+    def __init__(self, slots, values, scale=1.0, offset=0.0):
+        self.slots = slots
+        self.values = values
+        self.scale = scale
+        self.offset = offset
+
+    def lookup(self, codes):
+        slots = self.slots[codes]
+        values = self.values[slots].astype(np.float64) * self.scale + self.offset
+        return np.where(slots >= 0, values, 0.0)
+
+
+def quantize(values, dtype):
+    dtype = np.dtype(dtype)
+
+    if dtype.kind == 'f':
+        return values.astype(dtype), 1.0, 0.0
+
+    info = np.iinfo(dtype)
+    low, high = float(values.min()), float(values.max())
+    scale = (high - low) / (info.max - info.min) or 1.0
+    offset = low - info.min * scale
+
+    quantized = np.round((values - offset) / scale)
+    return np.clip(quantized, info.min, info.max).astype(dtype), scale, offset
+
+
+def convert(input_path=npz_path, output_path=compact_path, dtype='float16'):
+    """Convert the dense Q-value.npz into the compact format."""
+    Q = np.load(input_path)
+
+    codes = reachable_codes()
+    slots = np.full(NB_CODES, -1, dtype=np.int16)
+    slots[codes] = np.arange(len(codes))
+
+    arrays = {'slots': slots}
+    meta = {'dtype': np.dtype(dtype).name}
+
+    for name in table_names.values():
+        values, scale, offset = quantize(Q[name].reshape(-1)[codes], dtype)
+        arrays[name] = values
+        meta[name] = {'scale': scale, 'offset': offset}
+
+    save_arrays(output_path, arrays, meta=meta)
+
+    return arrays, meta
+
+
+def load_compact(path=compact_path, mmap=True):
+    arrays, meta = load_arrays(path, mmap=mmap)
+
+    return {
+        player: CompactQTable(arrays['slots'], arrays[name], **meta[name])
+        for player, name in table_names.items()
+    }
+
+
+def load_dense(path=npz_path):
+    Q = np.load(path)
+
+    return {
+        player: DenseQTable(Q[name])
+        for player, name in table_names.items()
+    }
+
+
+def load():
+    # Prefer the compact table when it has been generated.
+    if os.path.exists(compact_path):
+        return load_compact(compact_path)
+    return load_dense(npz_path)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default=npz_path)
+    parser.add_argument('--output', default=compact_path)
+    parser.add_argument('--dtype', choices=('float32', 'float16', 'int8'), default='float16')
+    args = parser.parse_args()
+
+    arrays, meta = convert(args.input, args.output, args.dtype)
+
+    dense = load_dense(args.input)
+    compact = load_compact(args.output)
+    codes = reachable_codes()
+    max_error = max(
+        np.max(np.abs(dense[player].lookup(codes) - compact[player].lookup(codes)))
+        for player in table_names
+    )
+
+    print(f'Saved {len(arrays["QX"])} reachable states as {meta["dtype"]} '
+          f'to {args.output} ({os.path.getsize(args.output)} bytes, '
+          f'max error {max_error:.4g}).')
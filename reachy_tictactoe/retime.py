@@ -0,0 +1,350 @@
+"""Retime the recorded trajectories to the fastest motion within joint limits.
+
+The trajectories are played back at the speed they were recorded by hand,
+pauses and hesitations included. Each trajectory move keeps its path in
+joint space, but the time spent along it is recomputed:
+
+- the jitter of the recorded positions under their resolution is dropped,
+  the recording is smoothed and reparametrized by the distance travelled,
+  which drops the time the arm stood (nearly) still,
+- the fastest speed along the path is computed with velocity and
+  acceleration limits on every joint (forward/backward integration of the
+  path speed, see time_optimal),
+- this speed profile is smoothed to limit the jerk, over the window giving
+  the shortest move, and stretched as a whole by the factor bringing every
+  joint back within its limits.
+
+By default, the limits of each joint are the ones it reaches in the
+recordings, so the retimed moves are never more violent than the recorded
+ones, and --speed-scale makes them faster (or slower) than that, e.g.:
+
+    python -m reachy_tictactoe.retime --speed-scale 1.2 --output moves-retimed.pack
+
+The retimed library (with the position moves as they are) is written as a
+packed move file, see motion.MotionLibrary.save. A move is only retimed
+when it gets shorter, it's kept as recorded otherwise.
+"""
+import logging
+
+import numpy as np
+
+from .motion import MotionLibrary
+
+
+logger = logging.getLogger('reachy.tictactoe.retime')
+
+
+def smooth(values, window, passes=1):
+    """Moving average of window samples along the last axis, edges repeated.
+
+    Every pass makes the values one derivative smoother: two passes turn a
+    piecewise linear trajectory into one of bounded jerk.
+    """
+    if window <= 1:
+        return values
+    if passes > 1:
+        return smooth(smooth(values, window), window, passes - 1)
+
+    padded = np.concatenate((
+        np.repeat(values[..., :1], window // 2, axis=-1),
+        values,
+        np.repeat(values[..., -1:], window - 1 - window // 2, axis=-1),
+    ), axis=-1)
+    cumsum = np.cumsum(np.concatenate((np.zeros(values.shape[:-1] + (1, )), padded), axis=-1), axis=-1)
+    return (cumsum[..., window:] - cumsum[..., :-window]) / window
+
+
+def deadband(positions, resolution):
+    """Drop the back and forth of the joints smaller than resolution.
+
+    Each joint only moves once it's more than resolution away from where it
+    stands, so the recording quantization and noise don't turn into tiny
+    reversals of the path.
+    """
+    filtered = np.array(positions, dtype=np.float64)
+    for i in range(1, filtered.shape[1]):
+        filtered[:, i] = np.clip(filtered[:, i - 1], positions[:, i] - resolution, positions[:, i] + resolution)
+    return filtered
+
+
+def pin_ends(values, start, end):
+    """Shift values linearly along the last axis so they go from start to end.
+
+    Unlike overwriting the first and last samples, this doesn't add any
+    jump to the (smoothed) values.
+    """
+    u = np.linspace(0, 1, values.shape[-1])
+    return values + np.outer(start - values[:, 0], 1 - u) + np.outer(end - values[:, -1], u)
+
+
+def derivatives(positions, freq):
+    """Velocity, acceleration and jerk of the trajectory, per joint and sample."""
+    velocity = np.diff(positions, axis=1) * freq
+    acceleration = np.diff(velocity, axis=1) * freq
+    jerk = np.diff(acceleration, axis=1) * freq
+    return velocity, acceleration, jerk
+
+
+def recorded_limits(trajectories, freq, window, percentile=99):
+    """Velocity, acceleration and jerk each joint reaches in the recordings."""
+    limits = [[], [], []]
+    for positions in trajectories:
+        for limit, values in zip(limits, derivatives(smooth(positions, window), freq)):
+            limit.append(np.abs(values))
+
+    return [np.percentile(np.concatenate(values, axis=1), percentile, axis=1) for values in limits]
+
+
+def path(positions, freq, min_speed, step):
+    """The recorded path, reparametrized by the distance travelled.
+
+    The distance is the largest displacement of the joints, the samples
+    where every joint moves slower than min_speed don't count. Returns the
+    distances, every step, and the positions there.
+    """
+    displacements = np.max(np.abs(np.diff(positions, axis=1)), axis=0)
+    displacements[displacements * freq < min_speed] = 0
+
+    distances = np.r_[0, np.cumsum(displacements)]
+    moving = np.r_[True, displacements > 0]
+    distances, positions = distances[moving], positions[:, moving]
+
+    s = np.linspace(0, distances[-1], max(int(np.ceil(distances[-1] / step)), 1) + 1)
+    return s, np.stack([np.interp(s, distances, p) for p in positions])
+
+
+def time_optimal(s, positions, max_velocity, max_acceleration):
+    """Fastest path speed ds/dt along s within the joint limits, from and to rest.
+
+    A joint speed is dq/ds * ds/dt and its acceleration dq/ds * d2s/dt2 +
+    d2q/ds2 * (ds/dt)^2, so the limits bound (ds/dt)^2 everywhere, and its
+    derivative along s. The speed is integrated backward with the largest
+    deceleration, then forward with the largest acceleration, each time
+    under the bounds.
+    """
+    ds = s[1] - s[0] if len(s) > 1 else 0
+    dq = np.gradient(positions, s, axis=1) if len(s) > 2 else np.zeros_like(positions)
+    ddq = np.gradient(dq, s, axis=1) if len(s) > 2 else np.zeros_like(positions)
+
+    with np.errstate(divide='ignore'):
+        # Bound of x = (ds/dt)^2 from the velocity limits, and from the
+        # acceleration of the joints which barely move along the path.
+        x_max = np.min((max_velocity[:, np.newaxis] / np.abs(dq)) ** 2, axis=0)
+        still = np.abs(dq) < 1e-6
+        x_max = np.minimum(x_max, np.min(np.where(
+            still, max_acceleration[:, np.newaxis] / np.abs(ddq), np.inf,
+        ), axis=0))
+
+        # Along a curved path, the joints need opposite accelerations of the
+        # path above some speed: joint j needs d2s/dt2 >= -A_j - C_j x and
+        # joint k d2s/dt2 <= A_k - C_k x.
+        A = np.where(still, np.inf, max_acceleration[:, np.newaxis] / np.abs(dq))
+        C = np.where(still, 0, ddq / np.where(still, 1, dq))
+        dC = C[np.newaxis] - C[:, np.newaxis]
+        with np.errstate(invalid='ignore'):
+            pairs = np.where(dC > 0, (A[:, np.newaxis] + A[np.newaxis]) / dC, np.inf)
+        x_max = np.minimum(x_max, np.min(pairs, axis=(0, 1)))
+
+    def acceleration_bounds(i, x):
+        # Range of d2s/dt2 keeping every joint within its acceleration limit.
+        moving = ~still[:, i]
+        if not np.any(moving):
+            return -np.inf, np.inf
+        a = (-max_acceleration[moving] - ddq[moving, i] * x) / dq[moving, i]
+        b = (max_acceleration[moving] - ddq[moving, i] * x) / dq[moving, i]
+        return np.max(np.minimum(a, b)), np.min(np.maximum(a, b))
+
+    x = np.minimum(x_max, np.finfo(np.float64).max)
+    x[0] = x[-1] = 0
+
+    for i in range(len(s) - 2, -1, -1):
+        low, _ = acceleration_bounds(i + 1, x[i + 1])
+        x[i] = min(x[i], max(x[i + 1] - 2 * ds * low, 0))
+
+    for i in range(len(s) - 1):
+        _, high = acceleration_bounds(i, x[i])
+        x[i + 1] = min(x[i + 1], max(x[i] + 2 * ds * high, 0))
+
+    return np.sqrt(x)
+
+
+def retime(positions, freq, max_velocity, max_acceleration, max_jerk,
+           min_speed=1.0, resolution=0.3, step=0.25, window=10, max_slowdown=10, max_iterations=5):
+    """Retime the (nb_joints, nb_samples) trajectory, see the module doc.
+
+    Raises a ValueError when the retimed trajectory would last more than
+    max_slowdown times the recorded one, or still exceeds a limit.
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    s, path_positions = path(smooth(deadband(positions, resolution), window), freq, min_speed, step)
+    if s[-1] == 0:
+        return positions[:, [0, -1]]
+    # The jitter left while the arm moves bends the path back and forth,
+    # which the acceleration limits would have to follow, so the path is
+    # smoothed along its length too, over a few times the resolution.
+    path_positions = smooth(path_positions, max(int(round(8 * resolution / step)), 1))
+    # The path was smoothed, its ends go back to the recorded ones.
+    path_positions = pin_ends(path_positions, positions[:, 0], positions[:, -1])
+
+    speeds = time_optimal(s, path_positions, max_velocity, max_acceleration)
+
+    # Time to go from each s to the next at the mean of their speeds, which
+    # never drops under min_speed (e.g. on the cusps of the path).
+    mean_speeds = (speeds[1:] + speeds[:-1]) / 2
+    times = np.r_[0, np.cumsum((s[1:] - s[:-1]) / np.maximum(mean_speeds, min_speed))]
+
+    max_duration = max_slowdown * positions.shape[1] / freq
+
+    def follow(scale, window):
+        # The move slowed down by scale. The smoothing window is scaled too,
+        # so the velocity, acceleration and jerk scale by exactly 1/scale,
+        # 1/scale^2 and 1/scale^3.
+        duration = scale * times[-1]
+        if duration > max_duration:
+            raise ValueError(
+                f'The retimed trajectory would last {duration:.1f} s, more than {max_slowdown} '
+                f'times the recorded one, the limits are too low or the recording too noisy'
+            )
+        w = int(round(window * scale))
+
+        # s(t) at freq is piecewise linear, smoothed twice so the
+        # acceleration ramps instead of switching.
+        t = np.arange(0, duration + 1 / freq, 1 / freq)
+        s_t = np.r_[np.zeros(2 * w), np.interp(t, scale * times, s), np.full(2 * w, s[-1])]
+        s_t = smooth(s_t, w, passes=2)
+        s_t = s_t[np.flatnonzero(s_t > 0)[0] - 1:np.flatnonzero(s_t < s[-1])[-1] + 2]
+
+        # Smoothed too, the path is only piecewise linear between its steps.
+        retimed = smooth(np.stack([np.interp(s_t, s, p) for p in path_positions]), w, passes=2)
+        return pin_ends(retimed, positions[:, 0], positions[:, -1])
+
+    def excess(retimed):
+        # The slow down bringing every joint back within its limits.
+        velocity, acceleration, jerk = (np.max(np.abs(d), axis=1) for d in derivatives(retimed, freq))
+        return max(
+            np.max(velocity / max_velocity),
+            np.max(acceleration / max_acceleration) ** (1 / 2),
+            np.max(jerk / max_jerk) ** (1 / 3),
+        )
+
+    # A longer smoothing lowers the jerk, so less slow down is needed, but
+    # it makes the move longer too: the window giving the shortest move
+    # once slowed down is kept.
+    candidates = []
+    for w in np.unique(np.round(window * 2 ** np.arange(0, 6, 0.5)).astype(int)):
+        retimed = follow(1.0, w)
+        k = max(excess(retimed), 1.0)
+        candidates.append((k * retimed.shape[1], k, w, retimed))
+    _, k, smoothing, retimed = min(candidates, key=lambda c: c[0])
+
+    # The first slow down is the one needed, up to the sampling, which the
+    # next ones correct. The scaled window is kept a whole number of samples.
+    scale = 1.0
+    for _ in range(max_iterations):
+        if k <= 1:
+            break
+        scale = np.ceil(smoothing * scale * k) / smoothing
+        retimed = follow(scale, smoothing)
+        k = excess(retimed)
+
+    if k > 1:
+        raise ValueError(f'The retimed trajectory still exceeds the limits {k:.2f} times')
+
+    return retimed
+
+
+def retime_library(library, speed_scale=1.0, max_velocity=None, max_acceleration=None,
+                   max_jerk=None, window=10, **kwargs):
+    """Retime every trajectory move of the library, returns the new library.
+
+    The limits are per joint arrays (in the order of library.joints) or
+    scalars, they default to the ones reached in the recordings. They are
+    scaled by speed_scale, its square and cube. The moves which can't be
+    retimed (see retime), or whose retimed timing isn't shorter, are kept as
+    recorded.
+    """
+    library.load()
+    trajectories = {name: move for name, move in library.items() if move.is_trajectory}
+
+    recorded = [np.zeros(len(library.joints)) for _ in range(3)]
+    for move in trajectories.values():
+        # Limits of the joints each move uses, in the library joints order.
+        indices = [library.joint_index[joint] for joint in move.joints]
+        for limits, values in zip(recorded, recorded_limits([move.positions], library.freq, window)):
+            limits[indices] = np.maximum(limits[indices], values)
+
+    limits = []
+    for i, given in enumerate((max_velocity, max_acceleration, max_jerk)):
+        limit = recorded[i] if given is None else np.broadcast_to(np.asarray(given, dtype=np.float64), recorded[i].shape)
+        limits.append(np.maximum(limit, 1e-6) * speed_scale ** (i + 1))
+
+    moves = {}
+    for name, move in library.items():
+        if move.is_trajectory:
+            indices = [library.joint_index[joint] for joint in move.joints]
+            try:
+                positions = retime(
+                    move.positions, library.freq, *(limit[indices] for limit in limits),
+                    window=window, **kwargs,
+                )
+            except ValueError as e:
+                logger.warning('Keeping the recorded timing of the move', extra={
+                    'move': name,
+                    'error': str(e),
+                })
+                positions = move.positions
+            else:
+                # e.g. a move recorded without any pause, at the limits.
+                if positions.shape[1] >= move.positions.shape[1]:
+                    logger.info('Keeping the recorded timing of the move, the retimed one is not shorter', extra={
+                        'move': name,
+                        'duration': move.duration,
+                        'retimed_duration': positions.shape[1] / library.freq,
+                    })
+                    positions = move.positions
+        else:
+            positions = move.positions[:, 0]
+        moves[name] = dict(zip(move.joints, positions))
+
+    return MotionLibrary.from_moves(moves, freq=library.freq)
+
+
+if __name__ == '__main__':
+    import argparse
+    import os
+
+    from .moves import dir_path, packed_path
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default=dir_path,
+                        help='directory of .npz moves, or packed move file')
+    parser.add_argument('--output', default=os.path.join(dir_path, 'moves-retimed.pack'))
+    parser.add_argument('--speed-scale', type=float, default=1.0)
+    parser.add_argument('--max-velocity', type=float, help='deg/s, all joints')
+    parser.add_argument('--max-acceleration', type=float, help='deg/s^2, all joints')
+    parser.add_argument('--max-jerk', type=float, help='deg/s^3, all joints')
+    parser.add_argument('--min-speed', type=float, default=1.0,
+                        help='deg/s under which the arm is considered still')
+    parser.add_argument('--resolution', type=float, default=0.3,
+                        help='deg, recorded jitter under which is dropped')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        parser.error(f'{args.input} does not exist')
+
+    if os.path.isdir(args.input):
+        library = MotionLibrary(args.input)
+    else:
+        library = MotionLibrary(packed_path=args.input)
+
+    retimed = retime_library(
+        library, args.speed_scale,
+        args.max_velocity, args.max_acceleration, args.max_jerk,
+        min_speed=args.min_speed, resolution=args.resolution,
+    )
+    retimed.save(args.output)
+
+    for name, move in library.items():
+        if move.is_trajectory:
+            print(f'{name:<20} {move.duration:6.2f} s -> {retimed[name].duration:6.2f} s')
+    print(f'Saved the retimed moves to {args.output}, replace {packed_path} with it to use them.')
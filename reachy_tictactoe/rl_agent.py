@@ -1,28 +1,45 @@
-import os
 import operator
 import numpy as np
 
+from functools import lru_cache
 
-q = os.path.join(os.path.dirname(__file__), 'Q-value.npz')
-Q = np.load(q)
+from . import qtable
+from .board import EMPTY, POW3, encode, encode_many
 
-Q = {1: Q['QX'], 2: Q['QO']}
 
+@lru_cache(maxsize=None)
+def get_q_tables():
+    return qtable.load()
 
-def value_actions(board, next_player=1):
-    possible_actions = np.where(np.array(board) == 0)[0]
 
-    possibilities = {}
-    for action in possible_actions:
-        next_board = board.copy()
-        next_board[action] = next_player
+def value_actions(board, next_player=1):
+    Q = get_q_tables()[next_player]
 
-        val = Q[next_player][tuple(next_board)]
-        possibilities[action] = val
+    # Q is indexed by the board after the move, i.e. by its base-3 code.
+    actions = np.where(np.asarray(board) == EMPTY)[0]
+    values = Q.lookup(encode(board) + next_player * POW3[actions])
 
-    possibilities = sorted(possibilities.items(), key=operator.itemgetter(1))
+    possibilities = sorted(zip(actions, values), key=operator.itemgetter(1))
 
     if next_player == 1:
         possibilities = list(reversed(possibilities))
 
     return possibilities
+
+
+def value_actions_batch(boards, next_player=1):
+    """Value of every action for an (N, 9) array of boards.
+
+    Returns an (N, 9) float array with NaN for the boxes that are already
+    taken. Unlike value_actions, actions are not sorted.
+    """
+    boards = np.asarray(boards)
+    Q = get_q_tables()[next_player]
+
+    next_codes = encode_many(boards)[:, np.newaxis] + next_player * POW3
+    legal = boards == EMPTY
+
+    values = np.full(boards.shape, np.nan, dtype=np.float64)
+    values[legal] = Q.lookup(next_codes[legal])
+
+    return values
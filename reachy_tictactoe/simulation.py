@@ -0,0 +1,401 @@
+import logging
+import time
+
+import numpy as np
+
+from collections import Counter
+
+from . import board as ttt_board
+from . import solver
+from . import vision
+from .clock import SimulatedClock
+from .game_launcher import run_game_loop
+from .inference import FakeBackend
+from .motion import MotionLibrary
+from .moves import moves as recorded_moves
+from .tictactoe_playground import TictactoePlayground
+from .timing import Profiler, format_report, profiler
+from .utils import piece2id
+
+
+logger = logging.getLogger('reachy.tictactoe.simulation')
+
+
+arm_joints = (
+    'right_arm.shoulder_pitch',
+    'right_arm.shoulder_roll',
+    'right_arm.arm_yaw',
+    'right_arm.elbow_pitch',
+    'right_arm.hand.forearm_yaw',
+    'right_arm.hand.wrist_pitch',
+    'right_arm.hand.wrist_roll',
+    'right_arm.hand.gripper',
+)
+head_joints = (
+    'head.left_antenna',
+    'head.right_antenna',
+)
+
+# Playground methods whose robot time is reported by the simulation.
+timed_phases = (
+    'analyze_board',
+    'choose_next_action',
+    'play_pawn',
+    'run_random_idle_behavior',
+    'run_my_turn',
+    'run_your_turn',
+    'shuffle_board',
+    'run_celebration',
+    'run_draw_behavior',
+    'run_defeat_behavior',
+)
+
+
+class FakeMotor(object):
+    def __init__(self, name, clock):
+        self.name = name
+        self.clock = clock
+
+        self.compliant = True
+        self.goal_position = 0.0
+        self.present_position = 0.0
+        self.torque_limit = 100.0
+        self.temperature = 35.0
+
+    def goto(self, goal_position, duration, wait=False, interpolation_mode='linear'):
+        self.goal_position = self.present_position = float(goal_position)
+        if wait:
+            self.clock.advance(duration)
+
+
+class FakePart(object):
+    def __init__(self, motors):
+        self.motors = list(motors)
+
+        for m in self.motors:
+            setattr(self, m.name.split('.')[-1], m)
+
+
+class FakeHand(FakePart):
+    def open(self):
+        self.gripper.goto(-30, duration=1, wait=True)
+
+
+class FakeCamera(object):
+    def __init__(self, world, period=0.0001):
+        self.world = world
+        self.period = period
+
+    def read(self):
+        # Like a real camera, block until the next frame (in wall time).
+        time.sleep(self.period)
+        return True, self.world.frame()
+
+
+class FakeReachy(object):
+    """Minimal stand-in for reachy.Reachy with the parts the playground uses."""
+
+    def __init__(self, clock, world):
+        self.clock = clock
+
+        self._motors = {name: FakeMotor(name, clock) for name in arm_joints + head_joints}
+        self.motors = list(self._motors.values())
+
+        arm_motors = [self._motors[name] for name in arm_joints]
+        self.right_arm = FakePart(arm_motors)
+        self.right_arm.hand = FakeHand(arm_motors[4:])
+
+        self.head = FakePart([self._motors[name] for name in head_joints])
+        self.head.right_camera = FakeCamera(world)
+
+    def goto(self, goal_positions, duration, wait=False,
+             interpolation_mode='linear', starting_point='present_position'):
+        for name, position in goal_positions.items():
+            if name in self._motors:
+                self._motors[name].goal_position = float(position)
+                self._motors[name].present_position = float(position)
+
+        if wait:
+            self.clock.advance(duration)
+
+    def close(self):
+        pass
+
+
+class FakeTrajectoryPlayer(object):
+    def __init__(self, reachy, trajectory, clock, freq=100):
+        self.reachy = reachy
+        self.trajectory = trajectory
+        self.clock = clock
+        self.freq = freq
+
+    def play(self, wait=False):
+        nb_samples = max(len(traj) for traj in self.trajectory.values())
+        self.reachy.goto({name: traj[-1] for name, traj in self.trajectory.items()}, duration=0)
+
+        if wait:
+            self.clock.advance(nb_samples / self.freq)
+
+
+def synthetic_moves(trajectory_duration=2.0, freq=100):
+    """Moves with the names the playground expects, all at the zero pose.
+
+    Used when the recorded moves are not available (e.g. when the git-lfs
+    files have not been fetched).
+    """
+    positions = ['base_pos', 'rest_pos', 'grip_pawn', 'lift', 'back_to_back', 'back_rest']
+    positions += [f'grab_{i}' for i in range(1, 6)]
+    positions += [f'back_{i}_upright' for i in range(1, 10)]
+
+    trajectories = ['shuffle-board', 'my-turn', 'your-turn']
+    trajectories += [f'put_{i}' for i in range(1, 10)]
+
+    nb_samples = int(trajectory_duration * freq)
+
+    moves = {name: {joint: np.array(0.0) for joint in arm_joints} for name in positions}
+    moves.update({
+        name: {joint: np.zeros(nb_samples) for joint in arm_joints}
+        for name in trajectories
+    })
+    return MotionLibrary.from_moves(moves, freq=freq)
+
+
+class SimulatedWorld(object):
+    """The physical board and the human opponent.
+
+    The camera frame shows every box as a uniform patch whose intensity is
+    decoded back to the right label by the fake box classifier. The human
+    plays once it's their turn and think_time seconds have passed.
+    """
+
+    frame_shape = (640, 640, 3)
+
+    def __init__(self, clock, human='random', think_time=3.0, seed=None):
+        self.clock = clock
+        self.human = human
+        self.think_time = think_time
+        self.rng = np.random.RandomState(seed)
+
+        # Intensity of a box per piece id, in the middle of its label band.
+        nb_labels = len(vision.get_labels('ttt-boxes'))
+        self.intensities = {
+            piece: (2 * label + 1) * 256 // (2 * nb_labels)
+            for label, piece in vision.get_box_ids().items()
+        }
+
+        # Cases are drawn where the board rectification expects them.
+        homography = vision.board_homography()
+        step = vision.canonical_size / 3
+        canonical = np.array([
+            [((col + i) * step, (row + j) * step, 1) for i, j in ((0, 0), (1, 0), (1, 1), (0, 1))]
+            for row in range(3)
+            for col in range(3)
+        ])
+        projected = canonical @ homography.T
+        self.case_polygons = np.round(
+            projected[..., :2] / projected[..., 2:]
+        ).astype(np.int32).reshape(3, 3, 4, 2)
+
+        self.reset()
+
+    def reset(self):
+        self.board = np.zeros(9, dtype=np.uint8)
+        self.human_turn_start = None
+        self._frame = None
+
+    def start_human_turn(self):
+        self.human_turn_start = self.clock.time()
+
+    def place(self, box, piece):
+        self.board[box] = piece2id[piece]
+        self._frame = None
+
+    def update(self):
+        if self.human_turn_start is None or ttt_board.is_final(self.board):
+            return
+        if self.clock.time() - self.human_turn_start < self.think_time:
+            return
+
+        if self.human == 'perfect':
+            actions = solver.best_actions(self.board, next_player=piece2id['cube'])
+        else:
+            actions = ttt_board.legal_moves(self.board)
+
+        self.place(self.rng.choice(actions), 'cube')
+        self.human_turn_start = None
+
+    def frame(self):
+        self.update()
+
+        if self._frame is None:
+            import cv2 as cv
+
+            self._frame = np.zeros(self.frame_shape, dtype=np.uint8)
+            for row in range(3):
+                for col in range(3):
+                    # The board is seen from the robot, see get_board_cells.
+                    piece = self.board[(2 - row) * 3 + (2 - col)]
+                    cv.fillConvexPoly(self._frame, self.case_polygons[row, col], (int(self.intensities[piece]), ) * 3)
+
+        return self._frame
+
+
+class SimulatedPlayground(TictactoePlayground):
+    def __init__(self, clock, world, moves=recorded_moves):
+        TictactoePlayground.__init__(self, robot=FakeReachy(clock, world), moves=moves, clock=clock)
+
+        self.world = world
+        self.snapshots = None
+        # The simulated frames have no grid to calibrate on.
+        self.observer.calibrator = None
+
+        # Compute time goes to the process-wide profiler, this one measures
+        # the (simulated) time the robot spends in each phase.
+        self.robot_profiler = Profiler(clock=clock)
+        for name in timed_phases:
+            setattr(self, name, self.robot_profiler.timed(name)(getattr(self, name)))
+
+    def trajectory_player(self, trajectory):
+        return FakeTrajectoryPlayer(self.reachy, trajectory, self.clock)
+
+    def coin_flip(self):
+        coin = TictactoePlayground.coin_flip(self)
+        if not coin:
+            self.world.start_human_turn()
+        return coin
+
+    def play_pawn(self, grab_index, box_index):
+        TictactoePlayground.play_pawn(self, grab_index, box_index)
+
+        self.world.place(box_index - 1, 'cylinder')
+        self.world.start_human_turn()
+
+    def shuffle_board(self):
+        TictactoePlayground.shuffle_board(self)
+        self.world.reset()
+
+
+def setup_fake_vision(reader='split'):
+    vision.configure(backend_name='fake', reader_name=reader)
+
+    # Small inputs keep the rectification cheap, the board is always valid.
+    boxes = vision.classifiers['ttt-boxes'] = FakeBackend(
+        len(vision.get_labels('ttt-boxes')), input_shape=(16, 16),
+    )
+    vision.classifiers['ttt-valid-board'] = FakeBackend(
+        len(vision.get_labels('ttt-valid-board')), input_shape=(16, 16),
+        predict=lambda tensor: (0, 1.0),
+    )
+
+    if reader == 'fused':
+        def read_board(board_img):
+            validity = np.float32((1, 0))
+            cells = np.zeros((9, boxes.nb_labels), dtype=np.float32)
+            for i, cell in enumerate(vision.board_cells(board_img)):
+                cells[i, boxes.band(cell)] = 1
+            return [validity, cells]
+
+        vision.classifiers[vision.fused_model] = FakeBackend(
+            None, input_shape=(48, 48), run=read_board,
+        )
+
+
+def recorded_moves_available():
+    try:
+        recorded_moves['base_pos']
+        return True
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def simulate(nb_games, human='random', think_time=3.0, seed=None, moves=None, reader='split'):
+    """Play nb_games against a simulated human, returns the run statistics."""
+    if moves is None:
+        if recorded_moves_available():
+            moves = recorded_moves
+        else:
+            logger.warning('Recorded moves unavailable, using synthetic ones')
+            moves = synthetic_moves()
+
+    np.random.seed(seed)
+    clock = SimulatedClock()
+
+    setup_fake_vision(reader)
+
+    world = SimulatedWorld(clock, human=human, think_time=think_time, seed=seed)
+    outcomes = Counter()
+
+    with SimulatedPlayground(clock, world, moves=moves) as playground:
+        playground.setup()
+        clock.reset_accounting()
+        profiler.reset()
+
+        start = time.perf_counter()
+
+        for _ in range(nb_games):
+            world.reset()
+            winner = run_game_loop(playground)
+            outcomes[winner or 'aborted'] += 1
+
+            if playground.need_cooldown():
+                playground.wait_for_cooldown()
+
+        wall_time = time.perf_counter() - start
+
+    return {
+        'games': nb_games,
+        'outcomes': dict(outcomes),
+        'wall_time': wall_time,
+        'virtual_time': clock.time(),
+        'decisions': profiler.stats['choose_next_action'].count,
+        'compute_time': profiler.report(),
+        'robot_time': playground.robot_profiler.report(),
+        'idle': clock.idle_report(),
+    }
+
+
+def print_report(stats):
+    wall_time = stats['wall_time']
+
+    print(f'Simulated {stats["games"]} games in {wall_time:.2f} s: '
+          f'{stats["games"] / wall_time:.1f} games/s, '
+          f'{stats["decisions"] / wall_time:.1f} decisions/s')
+    print('Outcomes: ' + ', '.join(f'{k} {v}' for k, v in sorted(stats['outcomes'].items())))
+    print(f'Robot time per game: {stats["virtual_time"] / stats["games"]:.1f} s')
+
+    for title, timings, unit in (
+        ('compute time', stats['compute_time'], 'ms'),
+        ('robot time', stats['robot_time'], 's'),
+    ):
+        print()
+        print(format_report(timings, title, unit))
+
+    print()
+    print(f'{"idle reason":<36} {"waits":>7} {"total [s]":>10}')
+    for reason, idle in sorted(stats['idle'].items(), key=lambda i: -i[1]['duration']):
+        print(f'{reason:<36} {idle["count"]:>7} {idle["duration"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--human', choices=('random', 'perfect'), default='random')
+    parser.add_argument('--think-time', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--synthetic-moves', action='store_true')
+    parser.add_argument('--reader', choices=('split', 'fused'), default='split')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    stats = simulate(
+        args.games,
+        human=args.human,
+        think_time=args.think_time,
+        seed=args.seed,
+        moves=synthetic_moves() if args.synthetic_moves else None,
+        reader=args.reader,
+    )
+    print_report(stats)
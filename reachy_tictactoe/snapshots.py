@@ -0,0 +1,170 @@
+import logging
+import os
+import re
+
+from collections import deque
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+
+
+logger = logging.getLogger('reachy.tictactoe.snapshots')
+
+
+snapshots_path = os.environ.get('REACHY_TICTACTOE_SNAPSHOTS', '/tmp/reachy-tictactoe-snapshots')
+# Keep every Nth analyzed frame (0 to only keep the ones around anomalies).
+snapshots_every = int(os.environ.get('REACHY_TICTACTOE_SNAPSHOTS_EVERY', 10))
+snapshots_max_size = int(os.environ.get('REACHY_TICTACTOE_SNAPSHOTS_MAX_MB', 200)) * 2 ** 20
+
+snapshot_name = re.compile(r'^(\d+)[.-].*\.jpg$')
+
+
+class SnapshotWriter(object):
+    """Saves some of the analyzed frames as JPEG in a background thread.
+
+    Every Nth frame is kept, as well as the context frames before and after
+    an anomaly (an invalid board, cheating...). Frames are only queued on
+    the game loop, their encoding and writing happen in the writer thread.
+    When the queue is full (e.g. the SD card is slow), the new frames are
+    dropped. Snapshots are named by increasing index, and the oldest ones
+    are removed once the directory goes over max_size bytes.
+    """
+
+    def __init__(self, path=snapshots_path, every=snapshots_every, context=3,
+                 max_size=snapshots_max_size, queue_size=8, quality=90):
+        self.path = path
+        self.every = every
+        self.context = context
+        self.max_size = max_size
+        self.quality = quality
+
+        self.queue = Queue(maxsize=queue_size)
+        # Recent frames not written yet, in case an anomaly happens.
+        self.recent = deque(maxlen=context)
+        self.nb_frames = 0
+        self.nb_after_anomaly = 0
+        self.nb_dropped = 0
+
+        self.index = 0
+        self.files = deque()
+        self.size = 0
+
+        self._running = Event()
+        self._t = None
+
+    def start(self):
+        if self._t is not None:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        self._scan()
+
+        self._running.set()
+        self._t = Thread(target=self._write_loop, daemon=True)
+        self._t.start()
+
+    def stop(self, timeout=2):
+        if self._t is None:
+            return
+
+        self._running.clear()
+        self._t.join(timeout)
+        self._t = None
+
+        if self.nb_dropped:
+            logger.warning('Snapshots dropped', extra={'nb_dropped': self.nb_dropped})
+
+    def add(self, img, tag='frame'):
+        """Add an analyzed frame, returns the path it will be saved to or None.
+
+        img must not be modified afterwards, it's encoded later on.
+        """
+        self.nb_frames += 1
+
+        if self.nb_after_anomaly > 0:
+            self.nb_after_anomaly -= 1
+            return self._push(img, tag)
+
+        if self.every > 0 and self.nb_frames % self.every == 0:
+            return self._push(img, tag)
+
+        self.recent.append((img, tag))
+
+    def anomaly(self, reason):
+        """Save the recent frames, the next context ones too."""
+        logger.info('Saving the snapshots around an anomaly', extra={'reason': reason})
+
+        while self.recent:
+            img, tag = self.recent.popleft()
+            self._push(img, f'{tag}-{reason}')
+        self.nb_after_anomaly = self.context
+
+    def _push(self, img, tag):
+        if self._t is None:
+            return
+
+        self.index += 1
+        path = os.path.join(self.path, f'{self.index:08d}-{tag}.jpg')
+        try:
+            self.queue.put_nowait((img, path))
+        except Full:
+            self.nb_dropped += 1
+            return
+
+        return path
+
+    def _scan(self):
+        # Carry on the numbering (and the size cap) of the previous runs.
+        snapshots = sorted(
+            (int(m.group(1)), name)
+            for name in os.listdir(self.path)
+            for m in [snapshot_name.match(name)] if m
+        )
+
+        self.files.clear()
+        self.size = 0
+        for _, name in snapshots:
+            path = os.path.join(self.path, name)
+            self.files.append((path, os.path.getsize(path)))
+            self.size += self.files[-1][1]
+
+        if snapshots:
+            self.index = max(self.index, snapshots[-1][0])
+
+    def _write_loop(self):
+        while self._running.is_set() or not self.queue.empty():
+            try:
+                img, path = self.queue.get(timeout=0.1)
+            except Empty:
+                continue
+
+            try:
+                self._write(img, path)
+            except Exception as e:
+                logger.warning('Could not save the snapshot', extra={
+                    'path': path,
+                    'error': str(e),
+                })
+
+    def _write(self, img, path):
+        import cv2 as cv
+
+        ok, data = cv.imencode('.jpg', img, (cv.IMWRITE_JPEG_QUALITY, self.quality))
+        if not ok:
+            raise ValueError('JPEG encoding failed')
+
+        # Written aside first, so a snapshot is never seen half written.
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data.tobytes())
+        os.replace(tmp_path, path)
+
+        self.files.append((path, len(data)))
+        self.size += len(data)
+
+        while self.size > self.max_size and len(self.files) > 1:
+            old_path, old_size = self.files.popleft()
+            self.size -= old_size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
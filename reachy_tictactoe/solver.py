@@ -0,0 +1,195 @@
+import logging
+import operator
+import os
+
+import numpy as np
+
+from .board import POW3, NB_CODES, WIN_LINES, encode, decode
+from .packed import load_arrays, save_arrays
+
+
+logger = logging.getLogger('reachy.tictactoe')
+
+
+# The 8 symmetries of the square, the transformed board is board[perm].
+_identity = np.arange(9).reshape(3, 3)
+SYMMETRIES = np.array([
+    np.rot90(grid, k).reshape(-1)
+    for grid in (_identity, _identity.T)
+    for k in range(4)
+])
+INVERSE_SYMMETRIES = np.argsort(SYMMETRIES, axis=1)
+
+# Sentinel for moves and states that are not in the table.
+NO_VALUE = np.iinfo(np.int8).min
+
+table_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'solver-table.pack')
+
+
+def _winners(boards):
+    winners = np.zeros(len(boards), dtype=np.uint8)
+    for player in (1, 2):
+        lines = np.all(boards[:, WIN_LINES] == player, axis=2)
+        winners[np.any(lines, axis=1)] = player
+    return winners
+
+
+def build_table():
+    """Solve the game for every position reachable from the empty board.
+
+    Either player may start, so a position is stored once for each player
+    allowed to move next. Positions are reduced by symmetry and keyed by
+    the smallest base-3 code among their 8 symmetric boards.
+
+    Values are given from player 1's point of view: a win scores the number
+    of empty boxes left plus one (so faster wins are preferred), a loss the
+    opposite and a draw 0.
+    """
+    # Players are numbered as in the agent Q-tables: 1 and 2, 0 is empty.
+    boards = decode(np.arange(NB_CODES)[:, np.newaxis])
+    winners = _winners(boards)
+    empties = np.sum(boards == 0, axis=1)
+
+    sym_codes = boards[:, SYMMETRIES] @ POW3
+    canonical = sym_codes.min(axis=1)
+    symmetry = sym_codes.argmin(axis=1).astype(np.uint8)
+
+    # Walk the game tree once, over canonical positions only.
+    values = {}
+
+    def solve(code, player):
+        if (code, player) in values:
+            return values[code, player]
+
+        board = boards[code]
+        if winners[code] or empties[code] == 0:
+            sign = {0: 0, 1: 1, 2: -1}[winners[code]]
+            value = sign * (int(empties[code]) + 1)
+        else:
+            children = [
+                solve(int(canonical[code + player * POW3[a]]), 3 - player)
+                for a in np.where(board == 0)[0]
+            ]
+            value = max(children) if player == 1 else min(children)
+
+        values[code, player] = value
+        return value
+
+    solve(0, 1)
+    solve(0, 2)
+
+    codes = np.array(sorted({code for code, _ in values}), dtype=np.int32)
+
+    slots = np.full(NB_CODES, -1, dtype=np.int16)
+    slots[codes] = np.arange(len(codes))
+    slots = slots[canonical]
+
+    state_values = np.full((len(codes), 2), NO_VALUE, dtype=np.int8)
+    action_values = np.full((len(codes), 2, 9), NO_VALUE, dtype=np.int8)
+    best_actions = np.zeros((len(codes), 2), dtype=np.uint16)
+
+    for (code, player), value in values.items():
+        slot = slots[code]
+        state_values[slot, player - 1] = value
+
+        board = boards[code]
+        if winners[code] or empties[code] == 0:
+            continue
+
+        for a in np.where(board == 0)[0]:
+            action_values[slot, player - 1, a] = values[int(canonical[code + player * POW3[a]]), 3 - player]
+        best = np.where(action_values[slot, player - 1] == value)[0]
+        best_actions[slot, player - 1] = np.sum(1 << best)
+
+    return {
+        'slots': slots,
+        'symmetries': symmetry,
+        'codes': codes,
+        'values': state_values,
+        'action_values': action_values,
+        'best_actions': best_actions,
+    }
+
+
+def save_table(table, path=table_path):
+    save_arrays(path, table, meta={'encoding': 'base3', 'nb_states': len(table['codes'])})
+
+
+def load_table(path=table_path, mmap=True):
+    table, _ = load_arrays(path, mmap=mmap)
+    return table
+
+
+_table = None
+
+
+def get_table():
+    global _table
+
+    if _table is None:
+        if os.path.exists(table_path):
+            _table = load_table(table_path)
+        else:
+            logger.info('No precomputed solver table found, solving the game')
+            _table = build_table()
+
+    return _table
+
+
+def action_values(board, next_player=1):
+    """Exact value of every box for next_player, NO_VALUE for illegal moves."""
+    table = get_table()
+
+    code = encode(board)
+    slot = table['slots'][code]
+    if slot < 0 or table['values'][slot, next_player - 1] == NO_VALUE:
+        raise ValueError(f'Unreachable board {board} for player {next_player}.')
+
+    return table['action_values'][slot, next_player - 1][INVERSE_SYMMETRIES[table['symmetries'][code]]]
+
+
+def best_actions(board, next_player=1):
+    table = get_table()
+
+    code = encode(board)
+    slot = table['slots'][code]
+    if slot < 0 or table['values'][slot, next_player - 1] == NO_VALUE:
+        raise ValueError(f'Unreachable board {board} for player {next_player}.')
+
+    mask = int(table['best_actions'][slot, next_player - 1])
+    canonical_actions = [a for a in range(9) if mask & (1 << a)]
+
+    return sorted(SYMMETRIES[table['symmetries'][code]][canonical_actions].tolist())
+
+
+def value_actions(board, next_player=1):
+    """Drop-in replacement for rl_agent.value_actions using exact values."""
+    try:
+        values = action_values(board, next_player)
+    except ValueError:
+        logger.warning('Board not found in solver table', extra={
+            'board': board,
+            'next_player': next_player,
+        })
+        values = np.where(np.array(board) == 0, 0, NO_VALUE)
+
+    possibilities = [(a, int(values[a])) for a in np.where(np.array(board) == 0)[0]]
+    possibilities = sorted(possibilities, key=operator.itemgetter(1))
+
+    if next_player == 1:
+        possibilities = list(reversed(possibilities))
+
+    return possibilities
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=table_path)
+    args = parser.parse_args()
+
+    table = build_table()
+    save_table(table, args.output)
+
+    print(f'Saved {len(table["codes"])} positions to {args.output}.')
@@ -1,22 +1,28 @@
 import numpy as np
 import logging
-import time
 import os
 
 
+from functools import lru_cache
 from threading import Thread, Event
 
-import reachy
 # from reachy import Reachy
 # from reachy.parts import RightArm, Head
 # from reachy.parts.arm import RightForceGripper
 # from reachy.trajectory import TrajectoryPlayer
 
-from .vision import get_board_configuration, is_board_valid
-from .utils import piece2id, id2piece, piece2player
+from .utils import piece2id
+from .motion import blend_waypoints
 from .moves import moves  # , rest_pos, base_pos
-from .rl_agent import value_actions
+from .solver import value_actions
 from . import behavior
+from . import board as ttt_board
+from .calibration import Calibrator
+from .camera import CameraStream
+from .clock import Clock
+from .observer import BoardObserver
+from .snapshots import SnapshotWriter
+from .timing import span, timed
 
 from collections import OrderedDict
 
@@ -24,7 +30,13 @@ from collections import OrderedDict
 logger = logging.getLogger('reachy.tictactoe')
 
 
+class NoImageError(RuntimeError):
+    """No image came from the camera, Reachy is rebooting."""
+
+
 def patch_force_gripper(forceGripper):
+    import reachy
+
     def __init__(self, root, io):
         """Create a new Force Gripper Hand."""
         reachy.parts.hand.Hand.__init__(self, root=root, io=io)
@@ -61,6 +73,8 @@ def patch_head_config(head_cls):
     return head_cls
 
 def patch_head(head_cls):
+    import reachy
+
     def __init__(self, io, default_camera='right'):
         """Create new Head part."""
         reachy.parts.part.ReachyPart.__init__(self, name='head', io=io)
@@ -75,29 +89,60 @@ def patch_head(head_cls):
 
     return head_cls
 
-reachy.parts.arm.RightForceGripper = patch_force_gripper(reachy.parts.arm.RightForceGripper)
-reachy.parts.Head = patch_head_config(reachy.parts.Head)
-reachy.parts.Head = patch_head(reachy.parts.Head)
+
+@lru_cache(maxsize=None)
+def import_reachy():
+    # The SDK is heavy to import and we patch some of its hardware classes,
+    # so this is only done once, when a playground is actually created.
+    import reachy
+
+    reachy.parts.arm.RightForceGripper = patch_force_gripper(reachy.parts.arm.RightForceGripper)
+    reachy.parts.Head = patch_head_config(reachy.parts.Head)
+    reachy.parts.Head = patch_head(reachy.parts.Head)
+
+    return reachy
+
 
 class TictactoePlayground(object):
-    def __init__(self):
+    def __init__(self, robot=None, moves=moves, clock=None):
         logger.info('Creating the playground')
 
-        self.reachy = reachy.Reachy(
-            right_arm=reachy.parts.RightArm(
-                io='/dev/ttyUSB*',
-                hand='force_gripper',
-            ),
-            head=reachy.parts.Head(
-                io='/dev/ttyUSB*',
-            ),
-        )
+        # A robot can be given to run the playground without the hardware,
+        # see the simulation module.
+        if robot is None:
+            reachy = import_reachy()
+            robot = reachy.Reachy(
+                right_arm=reachy.parts.RightArm(
+                    io='/dev/ttyUSB*',
+                    hand='force_gripper',
+                ),
+                head=reachy.parts.Head(
+                    io='/dev/ttyUSB*',
+                ),
+            )
+        self.reachy = robot
+        self.moves = moves
+        self.clock = clock if clock is not None else Clock()
+        self.camera = CameraStream(self.reachy.head.right_camera, clock=self.clock)
+        self.observer = BoardObserver(self.camera, clock=self.clock, calibrator=Calibrator())
+
+        # None to not save any snapshot.
+        self.snapshots = SnapshotWriter()
 
         self.pawn_played = 0
 
     def setup(self):
         logger.info('Setup the playground')
 
+        # Every move is read now, none while playing.
+        self.moves.load()
+        if self.observer.calibrator is not None:
+            self.observer.calibrator.load()
+        self.camera.start()
+        self.observer.start()
+        if self.snapshots is not None:
+            self.snapshots.start()
+
         for antenna in self.reachy.head.motors:
             antenna.compliant = False
             antenna.goto(
@@ -116,6 +161,10 @@ class TictactoePlayground(object):
                 'exc': exc,
             }
         )
+        self.observer.stop()
+        self.camera.stop()
+        if self.snapshots is not None:
+            self.snapshots.stop()
         self.reachy.close()
 
     # Playground and game functions
@@ -140,9 +189,19 @@ class TictactoePlayground(object):
 
         # self.reachy.head.look_at(0.5, y, z, duration=1.5, wait=True)
 
-    def run_random_idle_behavior(self):
+    @timed('run_random_idle_behavior')
+    def run_random_idle_behavior(self, board=None):
         logger.info('Reachy is playing a random idle behavior')
-        time.sleep(2)
+
+        if board is None:
+            self.clock.sleep(2, reason='idle_behavior')
+            return
+
+        # Stop as soon as the board is seen changing (e.g. the human played).
+        self.clock.wait_until(
+            lambda: self.observer.board_changed(board),
+            timeout=2, period=0.05, reason='idle_behavior',
+        )
 
     def coin_flip(self):
         coin = np.random.rand() > 0.5
@@ -154,24 +213,22 @@ class TictactoePlayground(object):
         )
         return coin
 
+    @timed('analyze_board')
     def analyze_board(self):
         # for disk in self.reachy.head.neck.disks:
         #     disk.compliant = False
 
-        time.sleep(0.1)
+        self.wait_for_head(timeout=0.1)
 
         # self.reachy.head.look_at(0.5, 0, z=-0.6, duration=1, wait=True)
-        time.sleep(0.2)
+        self.wait_for_head(timeout=0.2)
 
-        # Wait an image from the camera
-        self.wait_for_img()
-        success, img = self.reachy.head.right_camera.read()
+        # Get the analysis of an image taken once the head is in position
+        observation = self.wait_for_board(min_timestamp=self.clock.time())
 
-        # TEMP:
-        import cv2 as cv
-        i = np.random.randint(1000)
-        path = f'/tmp/snap.{i}.jpg'
-        cv.imwrite(path, img)
+        path = None
+        if self.snapshots is not None:
+            path = self.snapshots.add(observation.img)
 
         logger.info(
             'Getting an image from camera',
@@ -181,35 +238,34 @@ class TictactoePlayground(object):
             },
         )
 
-        if not is_board_valid(img):
+        if not observation.stable:
+            self.snapshot_anomaly('unstable' if observation.valid else 'invalid')
             # self.reachy.head.compliant = False
-            time.sleep(0.1)
+            self.wait_for_head(timeout=0.1)
             # self.reachy.head.look_at(1, 0, 0, duration=0.75, wait=True)
             return
 
-        tic = time.time()
-        
-        success, img = self.reachy.head.right_camera.read()
-        board, _ = get_board_configuration(img)
+        board = observation.board.copy()
 
         # TEMP
         logger.info(
             'Board analyzed',
             extra={
                 'board': board,
+                'confidence': observation.confidence,
                 'img_path': path,
             },
         )
 
         # self.reachy.head.compliant = False
-        time.sleep(0.1)
+        self.wait_for_head(timeout=0.1)
         # self.reachy.head.look_at(1, 0, 0, duration=0.75, wait=True)
 
-        return board.flatten()
+        return board
 
     def incoherent_board_detected(self, board):
-        nb_cubes = len(np.where(board == piece2id['cube'])[0])
-        nb_cylinders = len(np.where(board == piece2id['cylinder'])[0])
+        nb_cubes = ttt_board.count(board, 'cube')
+        nb_cylinders = ttt_board.count(board, 'cylinder')
 
         if abs(nb_cubes - nb_cylinders) <= 1:
             return False
@@ -217,6 +273,7 @@ class TictactoePlayground(object):
         logger.warning('Incoherent board detected', extra={
             'current_board': board,
         })
+        self.snapshot_anomaly('incoherent')
 
         return True
 
@@ -243,39 +300,37 @@ class TictactoePlayground(object):
             'last_board': last_board,
             'current_board': board,
         })
+        self.snapshot_anomaly('cheating')
 
         return True
 
+    def snapshot_anomaly(self, reason):
+        if self.snapshots is not None:
+            self.snapshots.anomaly(reason)
+
+    @timed('shuffle_board')
     def shuffle_board(self):
         def ears_no():
             d = 3
             f = 2
-            time.sleep(2.5)
+            self.clock.sleep(2.5, reason='antennas')
             t = np.linspace(0, d, d * 100)
             p = 25 + 25 * np.sin(2 * np.pi * f * t)
             for pp in p:
                 self.reachy.head.left_antenna.goal_position = pp
-                time.sleep(0.01)
+                self.clock.sleep(0.01, reason='antennas')
 
         t = Thread(target=ears_no)
         t.start()
 
         self.goto_base_position()
         # self.reachy.head.look_at(0.5, 0, -0.4, duration=1, wait=False)
-        m = moves['shuffle-board']  # Trevor change
-        j = {
-            m: j
-            for j, m in zip(
-                np.array(list(m.values()))[:, 0],
-                list(m.keys())
-            )
-        }
-        self.goto_position(j, duration=0.5, wait=True)
-        reachy.trajectory.TrajectoryPlayer(self.reachy, m).play(wait=True)
+        self.play_trajectory('shuffle-board')
         self.goto_rest_position()
         # self.reachy.head.look_at(1, 0, 0, duration=1, wait=True)
         t.join()
 
+    @timed('choose_next_action')
     def choose_next_action(self, board):
         actions = value_actions(board)
 
@@ -333,6 +388,7 @@ class TictactoePlayground(object):
 
         return board
 
+    @timed('play_pawn')
     def play_pawn(self, grab_index, box_index):
         # self.reachy.head.look_at(
         #    0.3, -0.3, -0.3,
@@ -341,168 +397,94 @@ class TictactoePlayground(object):
         # )
 
         # Goto base position
-        self.goto_base_position()
-
-        if grab_index >= 4:
-            self.goto_position(
-                moves['grab_3'],
-                duration=1,
-                wait=True,
+        with span('play_pawn.base'):
+            self.goto_base_position()
+
+        # The arm only stops where the gripper acts, it goes through the
+        # other positions without stopping (see play_sequence).
+        with span('play_pawn.grab'):
+            waypoints = [(self.moves['grab_3'], 1)] if grab_index >= 4 else []
+            # Grab the pawn at grab_index
+            waypoints.append((self.moves[f'grab_{grab_index}'], 1))
+            self.play_sequence(waypoints)
+
+            self.goto_position(  # Trevor change
+                self.moves['grip_pawn'],
+                duration=0.5,
+                wait=True
             )
 
-        # Grab the pawn at grab_index
-        self.goto_position(
-            moves[f'grab_{grab_index}'],
-            duration=1,
-            wait=True,
-        )
-        self.goto_position(  # Trevor change
-            moves['grip_pawn'],
-            duration=0.5,
-            wait=True
-        )
-
         self.reachy.head.left_antenna.goto(45, 1, interpolation_mode='minjerk')
         self.reachy.head.right_antenna.goto(-45, 1, interpolation_mode='minjerk')
 
-        if grab_index >= 4:
-            self.reachy.goto({
-                'right_arm.shoulder_pitch': self.reachy.right_arm.shoulder_pitch.goal_position + 10,
-                'right_arm.elbow_pitch': self.reachy.right_arm.elbow_pitch.goal_position - 30,
-            }, duration=1,
-               wait=True,
-               interpolation_mode='minjerk',
-               starting_point='goal_position',
-            )
-
-        # Lift it
-        self.goto_position(
-            moves['lift'],
-            duration=1,
-            wait=True,
-        )
-
-        # self.reachy.head.look_at(0.5, 0, -0.35, duration=0.5, wait=False)
-        time.sleep(0.1)
-
-        # Put it in box_index
-        put = moves[f'put_{box_index}']  # Trevor change
-        j = {
-            m: j
-            for j, m in zip(
-                np.array(list(put.values()))[:, 0],
-                list(put.keys())
-            )
-        }
-        self.goto_position(j, duration=0.5, wait=True)
-        reachy.trajectory.TrajectoryPlayer(self.reachy, put).play(wait=True)
-
-        self.reachy.right_arm.hand.open()
-
-        # Go back to rest position
-        self.goto_position(
-            moves[f'back_{box_index}_upright'],
-            duration=1,
-            wait=True,
-        )
+        # Lift it and put it in box_index
+        with span('play_pawn.put'):
+            waypoints = []
+            if grab_index >= 4:
+                waypoints.append(({
+                    'right_arm.shoulder_pitch': self.reachy.right_arm.shoulder_pitch.goal_position + 10,
+                    'right_arm.elbow_pitch': self.reachy.right_arm.elbow_pitch.goal_position - 30,
+                }, 1))
+            waypoints.append((self.moves['lift'], 1))
+            # self.reachy.head.look_at(0.5, 0, -0.35, duration=0.5, wait=False)
+            waypoints.append((self.moves[f'put_{box_index}'], 0.5))  # Trevor change
+            self.play_sequence(waypoints)
+
+        with span('play_pawn.release'):
+            self.reachy.right_arm.hand.open()
 
         self.reachy.head.left_antenna.goto(0, 0.2, interpolation_mode='minjerk')
         self.reachy.head.right_antenna.goto(0, 0.2, interpolation_mode='minjerk')
-
         # self.reachy.head.look_at(1, 0, 0, duration=1, wait=False)
 
-        if box_index in (8, 9):
-            self.goto_position(
-                moves['back_to_back'],
-                duration=1,
-                wait=True,
-            )
-
-        self.goto_position(
-            moves['back_rest'],
-            duration=2,
-            wait=True,
-        )
-
-        self.goto_rest_position()
+        # Go back to rest position
+        with span('play_pawn.back'):
+            waypoints = [(self.moves[f'back_{box_index}_upright'], 1)]
+            if box_index in (8, 9):
+                waypoints.append((self.moves['back_to_back'], 1))
+            waypoints.append((self.moves['back_rest'], 2))
+            # Same as goto_rest_position, without stopping at the base position.
+            waypoints.append((self.moves['base_pos'], 1.2))
+            waypoints.append((self.moves['rest_pos'], 0.8))
+            self.play_sequence(waypoints)
+
+        with span('play_pawn.rest'):
+            self.release_arm()
 
     def is_final(self, board):
-        winner = self.get_winner(board)
-        if winner in ('robot', 'human'):
-            return True
-        else:
-            return 0 not in board
+        return ttt_board.is_final(board)
 
     def has_human_played(self, current_board, last_board):
-        cube = piece2id['cube']
-
-        return (
-            np.any(current_board != last_board) and
-            np.sum(current_board == cube) > np.sum(last_board == cube)
-        )
+        return ttt_board.count(current_board, 'cube') > ttt_board.count(last_board, 'cube')
 
     def get_winner(self, board):
-        win_configurations = (
-            (0, 1, 2),
-            (3, 4, 5),
-            (6, 7, 8),
-
-            (0, 3, 6),
-            (1, 4, 7),
-            (2, 5, 8),
-
-            (0, 4, 8),
-            (2, 4, 6),
-        )
-
-        for c in win_configurations:
-            trio = set(board[i] for i in c)
-            for id in id2piece.keys():
-                if trio == set([id]):
-                    winner = piece2player[id2piece[id]]
-                    if winner in ('robot', 'human'):
-                        return winner
-
-        return 'nobody'
+        return ttt_board.winner(board)
 
+    @timed('run_celebration')
     def run_celebration(self):
         logger.info('Reachy is playing its win behavior')
-        behavior.happy(self.reachy)
+        behavior.happy(self.reachy, clock=self.clock)
 
+    @timed('run_draw_behavior')
     def run_draw_behavior(self):
         logger.info('Reachy is playing its draw behavior')
-        behavior.surprise(self.reachy)
+        behavior.surprise(self.reachy, clock=self.clock)
 
+    @timed('run_defeat_behavior')
     def run_defeat_behavior(self):
         logger.info('Reachy is playing its defeat behavior')
-        behavior.sad(self.reachy)
+        behavior.sad(self.reachy, clock=self.clock)
 
+    @timed('run_my_turn')
     def run_my_turn(self):
         self.goto_base_position()
-        m = moves['my-turn']  # Trevor change
-        j = {
-            m: j
-            for j, m in zip(
-                np.array(list(m.values()))[:, 0],
-                list(m.keys())
-            )
-        }
-        self.goto_position(j, duration=0.5, wait=True)
-        reachy.trajectory.TrajectoryPlayer(self.reachy, m).play(wait=True)
+        self.play_trajectory('my-turn')
         self.goto_rest_position()
 
+    @timed('run_your_turn')
     def run_your_turn(self):
         self.goto_base_position()
-        m = moves['your-turn']  # Trevor change
-        j = {
-            m: j
-            for j, m in zip(
-                np.array(list(m.values()))[:, 0],
-                list(m.keys())
-            )
-        }
-        self.goto_position(j, duration=0.5, wait=True)
-        reachy.trajectory.TrajectoryPlayer(self.reachy, m).play(wait=True)
+        self.play_trajectory('your-turn')
         self.goto_rest_position()
 
     # Robot lower-level control functions
@@ -516,47 +498,93 @@ class TictactoePlayground(object):
             starting_point='goal_position',
         )
 
+    def play_trajectory(self, name, approach_duration=0.5):
+        """Go to the start of a trajectory move, then play it."""
+        move = self.moves[name]
+        self.goto_position(move.start, duration=approach_duration, wait=True)
+        self.trajectory_player(move).play(wait=True)
+
+    def play_sequence(self, waypoints):
+        """Move the arm through the (pose, duration) waypoints without stopping.
+
+        See motion.blend_waypoints, the arm starts from its current goal
+        position and only stops at the last waypoint.
+        """
+        start = {m.name: m.goal_position for m in self.reachy.right_arm.motors}
+        trajectory = blend_waypoints(start, waypoints, freq=self.moves.freq)
+        self.trajectory_player(trajectory).play(wait=True)
+
+    def trajectory_player(self, trajectory):
+        return import_reachy().trajectory.TrajectoryPlayer(self.reachy, trajectory)
+
     def goto_base_position(self, duration=2.0):
         for m in self.reachy.right_arm.motors:
             m.compliant = False
 
-        time.sleep(0.1)
+        self.clock.sleep(0.1, reason='stiffen_arm')
 
         self.reachy.right_arm.shoulder_pitch.torque_limit = 75
         self.reachy.right_arm.elbow_pitch.torque_limit = 75
-        time.sleep(0.1)
+        self.clock.sleep(0.1, reason='torque_limit')
 
-        self.goto_position(moves['base_pos'], duration, wait=True)  # Trevor change
+        self.goto_position(self.moves['base_pos'], duration, wait=True)  # Trevor change
 
+    @timed('goto_rest_position')
     def goto_rest_position(self, duration=2.0):
-        # FIXME: Why is it needed?
-        time.sleep(0.1)
+        # The previous move may still be settling when we get here.
+        self.wait_for_arm(timeout=0.1)
 
         self.goto_base_position(0.6 * duration)
-        time.sleep(0.1)
+        self.wait_for_arm(timeout=0.1)
+
+        self.goto_position(self.moves['rest_pos'], 0.4 * duration, wait=True)  # Trevor change
+        self.release_arm()
 
-        self.goto_position(moves['rest_pos'], 0.4 * duration, wait=True)  # Trevor change
-        time.sleep(0.1)
+    def release_arm(self):
+        self.wait_for_arm(timeout=0.1)
 
         self.reachy.right_arm.shoulder_pitch.torque_limit = 0
         self.reachy.right_arm.elbow_pitch.torque_limit = 0
 
-        time.sleep(0.25)
+        self.clock.sleep(0.25, reason='torque_limit')
 
         for m in self.reachy.right_arm.motors:
             if m.name != 'right_arm.shoulder_pitch':
                 m.compliant = True
 
-        time.sleep(0.25)
+        self.clock.sleep(0.25, reason='release_arm')
 
-    def wait_for_img(self):
-        start = time.time()
-        while time.time() - start <= 30:
-            success, img = self.reachy.head.right_camera.read()
-            if img != []:
-                return
-        logger.warning('No image received for 30 sec, going to reboot.')
+    def wait_for_motors(self, motors, timeout, tolerance=2.0, reason='wait_for_motors'):
+        def reached():
+            return all(
+                abs(m.present_position - m.goal_position) <= tolerance
+                for m in motors
+            )
+
+        return self.clock.wait_until(reached, timeout=timeout, reason=reason)
+
+    def wait_for_arm(self, timeout):
+        return self.wait_for_motors(self.reachy.right_arm.motors, timeout, reason='wait_for_arm')
+
+    def wait_for_head(self, timeout):
+        return self.wait_for_motors(self.reachy.head.motors, timeout, reason='wait_for_head')
+
+    def wait_for_board(self, min_timestamp=None, timeout=30, settle_timeout=2):
+        observation = self.observer.get_latest(min_timestamp, timeout=timeout)
+        if observation is not None:
+            # Give the filtered board some frames to settle, e.g. after a
+            # pawn was just played. It's reported as invalid otherwise.
+            stable_observation = self.observer.get_latest(
+                min_timestamp, stable=True, timeout=settle_timeout,
+            )
+            return stable_observation if stable_observation is not None else observation
+
+        logger.warning(f'No image received for {timeout} sec, going to reboot.', extra={
+            'frame_age': self.camera.frame_age(),
+        })
         os.system('sudo reboot')
+        # The game can't go on until then, without any board to analyze.
+        raise NoImageError(f'No image received for {timeout} sec')
 
     def need_cooldown(self):
         motor_temperature = np.array([
@@ -576,7 +604,7 @@ class TictactoePlayground(object):
                 'temperatures': temperatures
             }
         )
-        return motor_temperature > 50  # or np.any(orbita_temperature > 45)
+        return np.any(motor_temperature > 50)  # or np.any(orbita_temperature > 45)
 
     def wait_for_cooldown(self):
         self.goto_rest_position()
@@ -601,10 +629,10 @@ class TictactoePlayground(object):
                 },
             )
 
-            if motor_temperature < 45:  # and np.all(orbita_temperature < 40):
+            if np.all(motor_temperature < 45):  # and np.all(orbita_temperature < 40):
                 break
 
-            time.sleep(30)
+            self.clock.sleep(30, reason='cooldown')
 
     def enter_sleep_mode(self):
         # self.reachy.head.look_at(0.5, 0, -0.65, duration=1.25, wait=True)
@@ -619,17 +647,17 @@ class TictactoePlayground(object):
             offset = 30
 
             while self._idle_running.is_set():
-                p = offset + amp * np.sin(2 * np.pi * f * time.time())
+                p = offset + amp * np.sin(2 * np.pi * f * self.clock.time())
                 self.reachy.head.left_antenna.goal_position = p
                 self.reachy.head.right_antenna.goal_position = -p
-                time.sleep(0.01)
+                self.clock.sleep(0.01, reason='sleep_mode')
 
         self._idle_t = Thread(target=_idle)
         self._idle_t.start()
 
     def leave_sleep_mode(self):
         # self.reachy.head.compliant = False
-        time.sleep(0.1)
+        self.wait_for_head(timeout=0.1)
         # self.reachy.head.look_at(1, 0, 0, duration=1, wait=True)
 
         self._idle_running.clear()
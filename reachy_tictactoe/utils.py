@@ -1,7 +1,7 @@
 piece2id = {
     'cube': 2,
-    'cylinder': 0,
-    'none': 1,
+    'cylinder': 1,
+    'none': 0,
 }
 
 id2piece = {
@@ -1,16 +1,13 @@
 import numpy as np
-import cv2 as cv
 import logging
 import os
 
-from PIL import Image
-
-from edgetpu.utils import dataset_utils
-from edgetpu.classification.engine import ClassificationEngine
-
+from functools import lru_cache
+from threading import Lock
 
 from .utils import piece2id
-from .detect_board import get_board_cases
+from .inference import load_backend, read_label_file
+from .timing import timed
 
 
 logger = logging.getLogger('reachy.tictactoe')
@@ -19,11 +16,105 @@ logger = logging.getLogger('reachy.tictactoe')
 dir_path = os.path.dirname(os.path.realpath(__file__))
 model_path = os.path.join(dir_path, 'models')
 
-boxes_classifier = ClassificationEngine(os.path.join(model_path, 'ttt-boxes.tflite'))
-boxes_labels = dataset_utils.read_label_file(os.path.join(model_path, 'ttt-boxes.txt'))
+# Which inference backend to use: 'auto' (Edge TPU with a CPU fallback),
+# 'edgetpu', 'tflite' or 'fake'.
+backend = os.environ.get('REACHY_TICTACTOE_BACKEND', 'auto')
+num_threads = os.environ.get('REACHY_TICTACTOE_NUM_THREADS')
+num_threads = int(num_threads) if num_threads else None
+
+# How the board is read: 'split' (the validity model, then the box model on
+# every cell), 'fused' (a single pass of the fused board model, see
+# read_fused) or 'auto' (fused when the fused model is available).
+readers = ('auto', 'split', 'fused')
+reader = os.environ.get('REACHY_TICTACTOE_READER', 'auto')
+fused_model = 'ttt-board'
+# Whether the fused reader is used, resolved on first use (see
+# use_fused_reader).
+fused_reader = None
+
+# Models are only loaded the first time they are needed (see get_classifier).
+classifiers = {}
+labels = {}
+classifiers_lock = Lock()
+
+# Preallocated rectified image of the board, filled in place on every
+# analysis (see warp_board). With the split reader, its cells are views
+# with the box classifier input shape, so they can be classified without
+# any per-cell allocation.
+board_input = None
+# cv.remap maps of the current board geometry, see get_warp_maps.
+warp_maps = {}
+# Fused reading of board_input, until the next warp (see read_fused).
+fused_reading = None
+
+
+def configure(backend_name=None, nb_threads=None, reader_name=None):
+    global backend, num_threads, reader, fused_reader, fused_reading
+
+    with classifiers_lock:
+        if reader_name is not None:
+            if reader_name not in readers:
+                raise ValueError(f'Unknown board reader "{reader_name}", should be one of {readers}.')
+            reader = reader_name
+
+        fused_reader = None
+        fused_reading = None
+
+        # The loaded classifiers don't depend on the reader.
+        if backend_name is not None or nb_threads is not None:
+            if backend_name is not None:
+                backend = backend_name
+            if nb_threads is not None:
+                num_threads = nb_threads
+            classifiers.clear()
+
 
-valid_classifier = ClassificationEngine(os.path.join(model_path, 'ttt-valid-board.tflite'))
-valid_labels = dataset_utils.read_label_file(os.path.join(model_path, 'ttt-valid-board.txt'))
+def get_labels(name):
+    if name not in labels:
+        labels[name] = read_label_file(os.path.join(model_path, f'{name}.txt'))
+    return labels[name]
+
+
+def get_classifier(name):
+    with classifiers_lock:
+        if name not in classifiers:
+            logger.info('Loading classifier', extra={
+                'model': name,
+                'backend': backend,
+            })
+            # The fused model uses the labels of the two others.
+            fused = name == fused_model
+            classifiers[name] = load_backend(
+                os.path.join(model_path, f'{name}.tflite'),
+                backend=backend,
+                nb_labels=None if fused else len(get_labels(name)),
+                num_threads=num_threads,
+                multi_output=fused,
+            )
+        return classifiers[name]
+
+
+def use_fused_reader():
+    global fused_reader
+
+    # 'auto' is resolved once, not on every frame.
+    if fused_reader is None:
+        if reader == 'auto':
+            fused_reader = (
+                fused_model in classifiers or
+                os.path.exists(os.path.join(model_path, f'{fused_model}.tflite'))
+            )
+        else:
+            fused_reader = reader == 'fused'
+    return fused_reader
+
+
+def get_box_ids():
+    # Maps the box classifier labels to the piece ids used by the game.
+    return {
+        label: piece2id['none' if name == 'empty' else name]
+        for label, name in get_labels('ttt-boxes').items()
+    }
 
 
 board_cases = np.array((#Coordinates first board cases (top-left corner) (Xbl, Xbr, Ytr, Ybr)
@@ -40,63 +131,302 @@ board_cases = np.array((#Coordinates first board cases (top-left corner) (Xbl, X
     (440, 610, 430, 580),),
 ))#Coordinates second board cases
 
-# left, right, top, bottom
+# Part of the frame (left, right, top, bottom) the validity classifier was
+# trained on, with the fixed board_cases.
 board_rect = np.array((
     100, 600, 180, 600,
 ))
 
+# Outer corners of the board in the frame, as given by the fixed
+# board_cases: top-left, top-right, bottom-right and bottom-left.
+board_corners = np.array((
+    board_cases[0, 0, [0, 2]],
+    board_cases[0, 2, [1, 2]],
+    board_cases[2, 2, [1, 3]],
+    board_cases[2, 0, [0, 3]],
+))
+
+# Side of the canonical board square the homographies map from.
+canonical_size = 300
+
+
+def board_homography(corners=board_corners):
+    """Homography from the canonical board square to the frame."""
+    import cv2 as cv
+
+    s = canonical_size
+    canonical = np.float32(((0, 0), (s, 0), (s, s), (0, s)))
+    return cv.getPerspectiveTransform(canonical, np.float32(corners))
+
+
+@lru_cache()
+def board_margins():
+    """Margins (left, right, top, bottom) of the rectified board around the
+    canonical board square, in canonical board coordinates.
+
+    They're the ones of board_rect around the fixed board, so the validity
+    classifier sees about the same part of the frame it was trained on.
+    """
+    corners = board_rect[[0, 2, 1, 2, 1, 3, 0, 3]].reshape(4, 2)
+    projected = np.c_[corners, np.ones(4)] @ np.linalg.inv(board_homography()).T
+    x, y = (projected[:, :2] / projected[:, 2:]).T
+
+    return tuple(float(max(m, 0)) for m in (-x.min(), x.max() - canonical_size, -y.min(), y.max() - canonical_size))
+
+
+def board_box(shape):
+    """(left, top, width, height) of the board square in a rectified board of shape."""
+    left, right, top, bottom = board_margins()
+    height, width = shape
+
+    size_x = canonical_size + left + right
+    size_y = canonical_size + top + bottom
+    return (
+        int(round(left / size_x * width)), int(round(top / size_y * height)),
+        int(round(canonical_size / size_x * width)), int(round(canonical_size / size_y * height)),
+    )
+
+
+def get_warp_maps(homography, shape):
+    """cv.remap maps from the frame to a rectified board of shape (height, width)."""
+    import cv2 as cv
+
+    key = (homography.tobytes(), tuple(shape))
+    if key not in warp_maps:
+        height, width = shape
+        left, top, box_width, box_height = board_box(shape)
+
+        # Centers of the rectified pixels, in canonical board coordinates.
+        v, u = np.mgrid[0:height, 0:width].astype(np.float64)
+        points = np.stack((
+            (u + 0.5 - left) * canonical_size / box_width,
+            (v + 0.5 - top) * canonical_size / box_height,
+            np.ones_like(u),
+        ), axis=-1)
+
+        projected = points @ homography.T
+        map_x = (projected[..., 0] / projected[..., 2] - 0.5).astype(np.float32)
+        map_y = (projected[..., 1] / projected[..., 2] - 0.5).astype(np.float32)
+
+        # Only the maps of the current geometry are kept.
+        warp_maps.clear()
+        warp_maps[key] = cv.convertMaps(map_x, map_y, cv.CV_16SC2)
+
+    return warp_maps[key]
+
+
+def board_shape():
+    """(height, width) of the rectified board, for the reader in use.
+
+    It's the input of the fused model, or 3x3 inputs of the box classifier
+    with the margins around, so only the models of the reader in use are
+    loaded.
+    """
+    if use_fused_reader():
+        return get_classifier(fused_model).input_shape
+
+    # The board box of this shape is exactly 3x3 inputs (see board_box).
+    height, width = get_classifier('ttt-boxes').input_shape
+    left, right, top, bottom = board_margins()
+    return (
+        int(round(3 * height * (canonical_size + top + bottom) / canonical_size)),
+        int(round(3 * width * (canonical_size + left + right) / canonical_size)),
+    )
 
-def get_board_configuration(img):
-    board = np.zeros((3, 3), dtype=np.uint8)
 
-    # try:
-    #     custom_board_cases = get_board_cases(img)
-    # except Exception as e:
-    #     logger.warning('Board detection failed', extra={'error': e})
-    #     custom_board_cases = board_cases
-    custom_board_cases = board_cases
+@timed('vision.warp_board')
+def warp_board(img, homography=None):
+    """Rectified RGB image of the board, of board_shape().
+
+    It's the board square with the margins of board_margins around. The
+    homography defaults to the one of the fixed board_corners, see the
+    calibration module for detected ones. The returned image is reused by
+    the next call.
+    """
+    import cv2 as cv
+
+    global board_input, fused_reading
+
+    shape = tuple(board_shape())
+    if board_input is None or board_input.shape[:2] != shape:
+        board_input = np.empty(shape + (3, ), dtype=np.uint8)
+
+    if homography is None:
+        homography = board_homography()
+
+    map1, map2 = get_warp_maps(homography, shape)
+    cv.remap(img, map1, map2, cv.INTER_NEAREST, dst=board_input)
+    cv.cvtColor(board_input, cv.COLOR_BGR2RGB, dst=board_input)
+    fused_reading = None
+
+    return board_input
+
+
+def board_cells(board_img):
+    """Views of the 9 cells of a rectified board, in the board_cases order."""
+    left, top, width, height = board_box(board_img.shape[:2])
+    height, width = height // 3, width // 3
+    return [
+        board_img[top + row * height:top + (row + 1) * height, left + col * width:left + (col + 1) * width]
+        for row in range(3)
+        for col in range(3)
+    ]
+
+
+def get_board_configuration(img, homography=None):
+    board = to_board(*get_board_cells(img, homography=homography))
     sanity_check = True
 
-    for row in range(3):
-        for col in range(3):
-            lx, rx, ly, ry = custom_board_cases[row, col]
-            piece, score = identify_box(img[ly:ry, lx:rx])
-            #if score < 0.9:
-            #    sanity_check = False
-            #    return [], sanity_check
-            # We invert the board to present it from the Human point of view
-            if score < 0.9:
-                piece = 0
-            board[2 - row, 2 - col] = piece
     return board, sanity_check
 
 
-def identify_box(box_img):
+def to_board(cells, scores, min_score=0.9):
+    # Low confidence cells are considered empty.
+    return np.where(scores < min_score, piece2id['none'], cells).astype(np.uint8)
+
+
+@timed('vision.get_board_cells')
+def get_board_cells(img, boxes=None, homography=None, board_img=None):
+    """Piece id and classifier score of the cells, as 3x3 arrays.
+
+    Only the boxes given (as indices in the flattened board) are
+    classified, the others are left to 0. The board is rectified with
+    homography (see warp_board), unless it already is given as board_img.
+    """
+    if board_img is None:
+        board_img = warp_board(img, homography)
+
+    if use_fused_reader():
+        _, cells, scores = read_fused(board_img)
+        if boxes is not None:
+            mask = np.isin(np.arange(9), boxes).reshape(3, 3)
+            cells, scores = np.where(mask, cells, 0).astype(np.uint8), np.where(mask, scores, 0)
+        return cells, scores
+
+    cells = np.zeros((3, 3), dtype=np.uint8)
+    scores = np.zeros((3, 3))
+
+    board_img_cells = board_cells(board_img)
+
+    # We invert the board to present it from the Human point of view,
+    # so box i of the flattened board is the case 8 - i.
+    cases = [8 - box for box in (range(9) if boxes is None else boxes)]
+
+    box_ids = get_box_ids()
+
+    for i, (label, score) in zip(cases, identify_boxes(board_img_cells[i] for i in cases)):
+        cells.flat[8 - i] = box_ids[label]
+        scores.flat[8 - i] = score
+
+    return cells, scores
+
 
-    res = boxes_classifier.classify_with_image(img_as_pil(box_img), top_k=1)
-    assert res
+def identify_boxes(boxes):
+    boxes_classifier = get_classifier('ttt-boxes')
+    # The cells already are inputs, unless the board was rectified for the
+    # fused reader.
+    return [boxes_classifier.classify(board_view(box, boxes_classifier.input_shape)) for box in boxes]
 
-    label, score = res[0]
 
-    return label, score
+@timed('vision.is_board_valid')
+def is_board_valid(img, homography=None, board_img=None):
+    """Whether the rectified board (see get_board_cells) is a valid board."""
+    if board_img is None:
+        board_img = warp_board(img, homography)
 
+    if use_fused_reader():
+        valid, _, _ = read_fused(board_img)
+        return valid
 
-def is_board_valid(img):
-    lx, rx, ly, ry = board_rect
-    board_img = img[ly:ry, lx:rx]
-    res = valid_classifier.classify_with_image(img_as_pil(board_img), top_k=1)
-    assert res
+    valid_classifier = get_classifier('ttt-valid-board')
+    label_index, score = valid_classifier.classify(
+        board_view(board_img, valid_classifier.input_shape)
+    )
 
-    label_index, score = res[0]
-    label = valid_labels[label_index]
+    return check_validity(label_index, score, valid_classifier)
 
-    logger.info('Board validity check', extra={
+
+def check_validity(label_index, score, classifier):
+    label = get_labels('ttt-valid-board')[label_index]
+
+    # Logged at debug level as it runs on every frame of the board observer.
+    logger.debug('Board validity check', extra={
         'label': label,
         'score': score,
+        'latency': classifier.last_latency,
     })
 
     return label == 'valid' and score > 0.65
 
 
-def img_as_pil(img):
-    return Image.fromarray(cv.cvtColor(img.copy(), cv.COLOR_BGR2RGB))
+def board_view(board_img, shape):
+    """The rectified board as an input of the given (height, width)."""
+    import cv2 as cv
+
+    # The rectified board is a multiple of the input most of the time, so
+    # the input is just a strided view.
+    height, width = shape
+    step_y, step_x = board_img.shape[0] // height, board_img.shape[1] // width
+    if board_img.shape[:2] == (step_y * height, step_x * width):
+        return board_img[::step_y, ::step_x]
+    return cv.resize(board_img, (width, height), interpolation=cv.INTER_AREA)
+
+
+def read_fused(board_img):
+    """Read the rectified board with a single pass of the fused model.
+
+    The fused model takes the whole rectified board and has two outputs:
+    the scores of the ttt-valid-board labels, and the scores of the
+    ttt-boxes labels for the 9 cells in the board_cases order. Returns the
+    validity, and the cells and scores as 3x3 arrays like get_board_cells.
+
+    The reading of board_input is kept until the next warp_board, so
+    is_board_valid and get_board_cells share a single pass.
+    """
+    global fused_reading
+
+    if board_img is not board_input:
+        return run_fused(board_img)
+
+    if fused_reading is None:
+        fused_reading = run_fused(board_img)
+    return fused_reading
+
+
+@timed('vision.read_fused')
+def run_fused(board_img):
+    model = get_classifier(fused_model)
+    validity_scores, cells_scores = model.run(board_view(board_img, model.input_shape))
+
+    label_index = int(np.argmax(validity_scores))
+    valid = check_validity(label_index, float(validity_scores[label_index]), model)
+
+    cells_scores = np.asarray(cells_scores).reshape(9, -1)
+    labels = np.argmax(cells_scores, axis=1)
+    box_ids = get_box_ids()
+    piece_ids = np.array([box_ids[label] for label in range(len(box_ids))], dtype=np.uint8)
+
+    # We invert the board to present it from the Human point of view.
+    cells = piece_ids[labels][::-1].reshape(3, 3)
+    scores = cells_scores[np.arange(9), labels][::-1].reshape(3, 3).astype(np.float64)
+
+    return valid, cells, scores
+
+
+def read_board(board_img, boxes=None):
+    """Validity, cells and scores of a rectified board.
+
+    The cells and scores (see get_board_cells) are None for an invalid
+    board. The split reader only classifies the given boxes, the fused one
+    reads the whole board in a single pass anyway.
+    """
+    if use_fused_reader():
+        valid, cells, scores = read_fused(board_img)
+    else:
+        valid = is_board_valid(None, board_img=board_img)
+        cells, scores = get_board_cells(None, boxes, board_img=board_img) if valid else (None, None)
+
+    if not valid:
+        return False, None, None
+    return True, cells, scores
+
@@ -0,0 +1,332 @@
+"""Benchmark the vision on recorded frames.
+
+Every frame of a directory (e.g. the snapshots, see the snapshots module)
+goes through the vision stages under each inference backend, and the
+throughput, latency, peak memory and accuracy are reported, e.g.:
+
+    python -m reachy_tictactoe.vision_benchmark /tmp/snapshots --boards boards.json
+
+Boards are a JSON object mapping frame file names to their flattened board
+(piece ids, see utils.piece2id), or null when the board isn't valid.
+Without it, only the speed is measured. The stages are benchmarked with
+each of the --readers (see vision.read_board), with --compare-readers
+their readings are compared on the same rectified boards instead. Each
+backend and reader runs in its own process, so the peak memory reported is
+the one of the run.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from glob import glob
+
+from . import detect_board, vision
+from .timing import Profiler
+from .utils import piece2id
+
+
+frame_extensions = ('.jpg', '.jpeg', '.png')
+
+# The board observer warps every frame and reads it once (see
+# observer.BoardObserver), the analysis is the first two stages.
+stages = ('warp_board', 'read_board', 'detect_board.get_board_cases')
+
+
+def list_frames(path):
+    return sorted(
+        p for p in glob(os.path.join(path, '*'))
+        if os.path.splitext(p)[1].lower() in frame_extensions
+    )
+
+
+def load_frames(path):
+    import cv2 as cv
+
+    return [(os.path.basename(p), cv.imread(p)) for p in list_frames(path)]
+
+
+def load_boards(path):
+    with open(path) as f:
+        boards = json.load(f)
+
+    return {
+        name: None if board is None else np.array(board, dtype=np.uint8).reshape(9)
+        for name, board in boards.items()
+    }
+
+
+def peak_memory():
+    """Peak resident memory of the process, in MB (see run_isolated)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Confusion(object):
+    """Confusion matrices of the validity and of the boxes, against the ground truth."""
+
+    def __init__(self):
+        self.nb_pieces = len(piece2id)
+        # validity[truth, prediction], with 1 for valid.
+        self.validity = np.zeros((2, 2), dtype=int)
+        # boxes[box, truth, prediction], over the boards valid in both.
+        self.boxes = np.zeros((9, self.nb_pieces, self.nb_pieces), dtype=int)
+
+    def add(self, truth, valid, board):
+        self.validity[int(truth is not None), int(valid)] += 1
+
+        if truth is not None and valid:
+            self.boxes[np.arange(9), truth, np.asarray(board).reshape(9)] += 1
+
+    @property
+    def validity_accuracy(self):
+        return np.trace(self.validity) / max(self.validity.sum(), 1)
+
+    @property
+    def box_accuracies(self):
+        """Accuracy of every box of the flattened board."""
+        return np.trace(self.boxes, axis1=1, axis2=2) / np.maximum(self.boxes.sum(axis=(1, 2)), 1)
+
+    @property
+    def box_accuracy(self):
+        boxes = self.boxes.sum(axis=0)
+        return np.trace(boxes) / max(boxes.sum(), 1)
+
+    def format(self):
+        names = sorted(piece2id, key=piece2id.get)
+        boxes = self.boxes.sum(axis=0)
+
+        lines = [
+            f'validity accuracy {self.validity_accuracy:.1%} '
+            f'(invalid seen as valid: {self.validity[0, 1]}, valid seen as invalid: {self.validity[1, 0]})',
+            f'box accuracy {self.box_accuracy:.1%}, per box: ' +
+            ' '.join(f'{a:.0%}' for a in self.box_accuracies),
+            f'{"truth / read":<14}' + ''.join(f'{name:>10}' for name in names),
+        ]
+        for name, row in zip(names, boxes):
+            lines.append(f'{name:<14}' + ''.join(f'{n:>10}' for n in row))
+
+        return '\n'.join(lines)
+
+
+def benchmark_stages(paths, boards=None, homography=None):
+    """Run the vision stages on every frame, with the current backend and reader.
+
+    The models are loaded (and timed as 'load') before the first frame.
+    Returns the profiler of the stages, the confusion (None without boards)
+    and the number of frames the board grid wasn't found on.
+    """
+    import cv2 as cv
+
+    profiler = Profiler()
+    confusion = Confusion() if boards is not None else None
+    nb_not_found = 0
+
+    with profiler.span('load'):
+        if vision.use_fused_reader():
+            vision.get_classifier(vision.fused_model)
+        else:
+            vision.get_classifier('ttt-valid-board')
+            vision.get_classifier('ttt-boxes')
+
+    for path in paths:
+        img = cv.imread(path)
+
+        with profiler.span('warp_board'):
+            board_img = vision.warp_board(img, homography)
+        with profiler.span('read_board'):
+            valid, cells, _ = vision.read_board(board_img)
+
+        with profiler.span('detect_board.get_board_cases'):
+            try:
+                detect_board.get_board_cases(img)
+            except ValueError:
+                nb_not_found += 1
+
+        if confusion is not None:
+            confusion.add(boards.get(os.path.basename(path)), valid, cells)
+
+    return profiler, confusion, nb_not_found
+
+
+def print_stages_report(backend, reader, profiler, confusion, nb_frames, nb_not_found):
+    report = profiler.report()
+    analysis = sum(report[stage]['total'] for stage in stages[:2])
+
+    print(f'== {backend} backend, {reader} reader')
+    print(f'{nb_frames} frames, {nb_frames / analysis:.1f} frames/s '
+          f'(warp_board + read_board), '
+          f'models loaded in {report["load"]["total"]:.2f} s, '
+          f'peak memory {peak_memory():.0f} MB')
+    print(f'{"stage":<32} {"p50 [ms]":>9} {"p95 [ms]":>9} {"p99 [ms]":>9} {"max [ms]":>9}')
+    for stage in stages:
+        stats = profiler.stats[stage]
+        p50, p95, p99 = (1e3 * stats.percentile(q) for q in (50, 95, 99))
+        print(f'{stage:<32} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f} {1e3 * stats.max:>9.2f}')
+    print(f'board grid not found on {nb_not_found} frames')
+
+    if confusion is not None:
+        print(confusion.format())
+    print()
+
+
+def read_frames(reader, board_imgs):
+    """Read every rectified board, returns the readings and the latencies."""
+    vision.configure(reader_name=reader)
+
+    # The models are loaded on the first reading, which isn't timed.
+    vision.read_board(board_imgs[0])
+
+    readings, latencies = [], []
+    for board_img in board_imgs:
+        start = time.perf_counter()
+        valid, cells, _ = vision.read_board(board_img)
+        latencies.append(time.perf_counter() - start)
+
+        readings.append(cells.reshape(9) if valid else None)
+
+    return readings, np.array(latencies)
+
+
+def accuracy(readings, references):
+    """Validity accuracy, and box accuracy over the boards valid in both."""
+    validity = np.mean([(r is None) == (ref is None) for r, ref in zip(readings, references)])
+
+    boxes = [
+        r == ref
+        for r, ref in zip(readings, references)
+        if r is not None and ref is not None
+    ]
+    box_accuracy = np.mean(boxes) if boxes else np.nan
+
+    return float(validity), float(box_accuracy)
+
+
+def compare_readers(frames, boards=None, readers=('split', 'fused'), homography=None):
+    # Readings are compared on the same rectified boards.
+    board_imgs = [vision.warp_board(img, homography).copy() for _, img in frames]
+
+    results = {}
+    for reader in readers:
+        readings, latencies = read_frames(reader, board_imgs)
+        results[reader] = {'readings': readings, 'latencies': latencies}
+
+    if boards is not None:
+        references = [boards.get(name) for name, _ in frames]
+    else:
+        references = results[readers[0]]['readings']
+
+    for result in results.values():
+        result['validity_accuracy'], result['box_accuracy'] = accuracy(result['readings'], references)
+
+    return results
+
+
+def print_readers_report(results, reference):
+    print(f'{"reader":<8} {"frames/s":>9} {"p50 [ms]":>9} {"p95 [ms]":>9} {"max [ms]":>9} '
+          f'{"validity":>9} {"boxes":>9}')
+    for reader, result in results.items():
+        latencies = 1e3 * result['latencies']
+        print(f'{reader:<8} {1e3 / latencies.mean():>9.1f} '
+              f'{np.percentile(latencies, 50):>9.2f} {np.percentile(latencies, 95):>9.2f} '
+              f'{latencies.max():>9.2f} '
+              f'{result["validity_accuracy"]:>9.1%} {result["box_accuracy"]:>9.1%}')
+    print(f'(accuracies against {reference})')
+
+
+def setup_backend(backend, reader):
+    """Use the given backend and reader, returns False if it can't load the models."""
+    if backend == 'fake':
+        from .simulation import setup_fake_vision
+
+        # Sets up the fake models of both readers, the reader is chosen after.
+        setup_fake_vision('fused')
+        vision.configure(reader_name=reader)
+        return True
+
+    vision.configure(backend_name=backend, reader_name=reader)
+    try:
+        vision.get_classifier(vision.fused_model if reader == 'fused' else 'ttt-boxes')
+    except (ImportError, RuntimeError, ValueError, OSError) as e:
+        print(f'Skipping the {backend} backend: {e}')
+        return False
+    return True
+
+
+def run_isolated(args, backend, readers):
+    """Run the benchmark of a backend and readers in a new process.
+
+    Its peak memory then only is the one of this backend and readers,
+    ru_maxrss being the peak of the whole process.
+    """
+    command = [
+        sys.executable, '-m', 'reachy_tictactoe.vision_benchmark', args.frames,
+        '--backends', backend, '--readers', *readers, '--calibration', args.calibration,
+    ]
+    if args.boards:
+        command += ['--boards', args.boards]
+    if args.compare_readers:
+        command.append('--compare-readers')
+
+    sys.stdout.flush()
+    subprocess.run(command)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from .calibration import Calibrator, calibration_path
+    from .inference import backends
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('frames')
+    parser.add_argument('--boards')
+    parser.add_argument('--backends', nargs='+', choices=backends, default=['edgetpu', 'tflite'])
+    parser.add_argument('--calibration', default=calibration_path)
+    parser.add_argument('--compare-readers', action='store_true')
+    parser.add_argument('--readers', nargs='+', choices=('split', 'fused'), default=['split', 'fused'])
+    args = parser.parse_args()
+
+    paths = list_frames(args.frames)
+    if not paths:
+        raise SystemExit(f'No frame found in {args.frames}')
+
+    # The readers are compared in the same run, benchmarked in their own.
+    runs = []
+    for backend in args.backends:
+        readers = args.readers
+        fused_path = os.path.join(vision.model_path, f'{vision.fused_model}.tflite')
+        if backend != 'fake' and 'fused' in readers and not os.path.exists(fused_path):
+            print(f'No fused model at {fused_path}, only benchmarking the split reader')
+            readers = [r for r in readers if r != 'fused'] or ['split']
+
+        if args.compare_readers:
+            runs.append((backend, readers))
+        else:
+            runs.extend((backend, [reader]) for reader in readers)
+
+    if len(runs) > 1:
+        for backend, readers in runs:
+            run_isolated(args, backend, readers)
+        raise SystemExit
+
+    backend, readers = runs[0]
+
+    calibrator = Calibrator(args.calibration)
+    calibrator.load()
+
+    boards = load_boards(args.boards) if args.boards else None
+
+    if not setup_backend(backend, readers[0]):
+        raise SystemExit
+
+    if not args.compare_readers:
+        profiler, confusion, nb_not_found = benchmark_stages(paths, boards, calibrator.homography)
+        print_stages_report(backend, readers[0], profiler, confusion, len(paths), nb_not_found)
+    else:
+        results = compare_readers(load_frames(args.frames), boards, readers, calibrator.homography)
+        print(f'== {backend} backend, {len(paths)} frames')
+        print_readers_report(results, 'the ground truth' if boards is not None else f'the {readers[0]} reader')
@@ -18,7 +18,7 @@ setup(
     author='Pollen-Robotics',
     author_email='contact@pollen-robotics.com',
     packages=find_packages(exclude=['tests']),
-    python_requires='>=3.5',
+    python_requires='>=3.7',
     install_requires=[
         'numpy',
         'zzlog',
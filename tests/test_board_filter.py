@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from reachy_tictactoe.board_filter import BoardFilter
+
+
+board = np.array([0, 1, 2, 0, 0, 1, 2, 0, 0], dtype=np.uint8)
+
+
+def test_settles_on_a_confident_board():
+    board_filter = BoardFilter()
+    filtered, confidence = board_filter.update(board, np.ones(9))
+
+    np.testing.assert_array_equal(filtered, board)
+    assert np.all(confidence == 1)
+    assert board_filter.stable
+
+
+def test_single_misread_frame_does_not_change_the_board():
+    board_filter = BoardFilter()
+    board_filter.update(board, np.ones(9))
+
+    misread = board.copy()
+    misread[0] = 2
+    filtered, _ = board_filter.update(misread, np.ones(9))
+
+    np.testing.assert_array_equal(filtered, board)
+    assert not board_filter.stable
+
+    for _ in range(5):
+        filtered, _ = board_filter.update(board, np.ones(9))
+    np.testing.assert_array_equal(filtered, board)
+    assert board_filter.stable
+
+
+def test_switches_after_a_few_frames():
+    board_filter = BoardFilter()
+    board_filter.update(board, np.ones(9))
+
+    played = board.copy()
+    played[3] = 2
+    for _ in range(10):
+        filtered, _ = board_filter.update(played, np.ones(9))
+
+    np.testing.assert_array_equal(filtered, played)
+    assert board_filter.stable
+
+
+def test_unsure_readings_settle_as_empty():
+    # The change detector doesn't read unchanged boxes again, so the same
+    # unsure reading is filtered over and over.
+    board_filter = BoardFilter()
+    scores = np.ones(9)
+    scores[1] = 0.75
+    for _ in range(200):
+        filtered, confidence = board_filter.update(board, scores)
+
+    assert board_filter.stable
+    assert filtered[1] == 0
+    assert confidence[1] >= board_filter.min_confidence
+
+
+def test_min_score_under_min_confidence():
+    with pytest.raises(ValueError):
+        BoardFilter(min_confidence=0.8, min_score=0.7)
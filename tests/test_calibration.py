@@ -0,0 +1,43 @@
+import numpy as np
+
+from reachy_tictactoe.calibration import Calibrator
+from reachy_tictactoe.detect_board import search_rect
+
+
+def board_frame(shift=0):
+    import cv2 as cv
+
+    # The grid lines in the part of the frame the board is looked for in.
+    lx, rx, ly, ry = search_rect
+    img = np.zeros((720, 1280, 3), dtype=np.uint8)
+    for i in range(4):
+        x = lx + 60 + 100 * i + shift
+        y = ly + 40 + 100 * i
+        cv.line(img, (lx + 20, y), (rx - 20, y), (255, 255, 255), 3)
+        cv.line(img, (x, ly + 10), (x, ry - 10), (255, 255, 255), 3)
+    return img
+
+
+def test_no_automatic_first_calibration(tmp_path):
+    calibrator = Calibrator(str(tmp_path / 'calibration.pack'))
+    assert not calibrator.load()
+
+    for _ in range(2 * calibrator.retry_period):
+        assert not calibrator.update(board_frame(), lambda: True)
+    assert calibrator.board_cases is None
+
+
+def test_calibrate_and_follow_the_drift(tmp_path):
+    path = str(tmp_path / 'state' / 'calibration.pack')
+    calibrator = Calibrator(path, patience=3, retry_period=0)
+    assert calibrator.recalibrate(board_frame())
+
+    loaded = Calibrator(path)
+    assert loaded.load()
+    np.testing.assert_array_equal(loaded.board_cases, calibrator.board_cases)
+
+    # Still board, then moved by 20 pixels for patience frames.
+    assert not any(calibrator.update(board_frame(), lambda: True) for _ in range(10))
+    moved = [calibrator.update(board_frame(20), lambda: True) for _ in range(3)]
+    assert moved == [False, False, True]
+    np.testing.assert_allclose(calibrator.board_cases[..., :2] - loaded.board_cases[..., :2], 20, atol=2)
@@ -0,0 +1,49 @@
+import time
+
+import numpy as np
+
+from reachy_tictactoe.camera import CameraStream
+from reachy_tictactoe.clock import Clock
+
+
+class Camera(object):
+    def __init__(self, working=True):
+        self.working = working
+        self.nb_reads = 0
+
+    def read(self):
+        self.nb_reads += 1
+        time.sleep(0.001)
+        if not self.working:
+            return False, None
+        return True, np.full((4, 4, 3), self.nb_reads % 256, dtype=np.uint8)
+
+
+def test_latest_frames():
+    stream = CameraStream(Camera())
+    stream.start()
+    try:
+        first = stream.get_latest(timeout=1)
+        second = stream.get_latest(after=first.index, timeout=1)
+    finally:
+        stream.stop()
+
+    assert first is not None and second is not None
+    assert second.index > first.index
+    assert second.timestamp >= first.timestamp
+
+
+def test_failed_reads_back_off():
+    camera = Camera(working=False)
+    clock = Clock()
+    stream = CameraStream(camera, clock=clock, min_backoff=0.01, max_backoff=0.05)
+    stream.start()
+    try:
+        assert stream.get_latest(timeout=0.5) is None
+    finally:
+        stream.stop()
+
+    # 0.01 + 0.02 + 0.04 + 0.05 + ... instead of a read every millisecond.
+    assert camera.nb_reads < 20
+    assert stream.nb_failures == camera.nb_reads
+    assert clock.idle_report()['wait_for_frame']['count'] == 1
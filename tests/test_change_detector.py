@@ -0,0 +1,55 @@
+import numpy as np
+
+from reachy_tictactoe.change_detector import ChangeDetector
+
+
+# Three boxes side by side, as (lx, rx, ly, ry).
+cases = np.array([(0, 16, 0, 16), (16, 32, 0, 16), (32, 48, 0, 16)])
+
+
+def frame(*intensities):
+    img = np.zeros((16, 48, 3), dtype=np.uint8)
+    for i, intensity in enumerate(intensities):
+        img[:, 16 * i:16 * (i + 1)] = intensity
+    return img
+
+
+def test_changed_boxes():
+    detector = ChangeDetector(cases, step=4)
+
+    changed, thumbnails = detector.changed(frame(0, 100, 200))
+    assert np.all(changed)
+    detector.update(thumbnails, np.where(changed)[0])
+
+    changed, thumbnails = detector.changed(frame(0, 105, 200))
+    assert not np.any(changed)
+    detector.update(thumbnails, [])
+
+    # The cases are in the flattened board order, the reverse of the cases.
+    changed, thumbnails = detector.changed(frame(0, 100, 50))
+    np.testing.assert_array_equal(changed, [True, False, False])
+
+
+def test_unclassified_boxes_stay_changed():
+    detector = ChangeDetector(cases, step=4)
+    detector.update(*[detector.changed(frame(0, 0, 0))[1], [0, 1, 2]])
+
+    changed, thumbnails = detector.changed(frame(200, 0, 0))
+    # An invalid frame: the boxes are not marked as classified.
+    detector.update(thumbnails, [])
+
+    np.testing.assert_array_equal(detector.changed(frame(200, 0, 0))[0], [False, False, True])
+
+
+def test_boxes_are_read_again_after_max_age():
+    detector = ChangeDetector(cases, step=4, max_age=3)
+    changed, thumbnails = detector.changed(frame(0, 0, 0))
+    detector.update(thumbnails, np.where(changed)[0])
+
+    for _ in range(3):
+        changed, thumbnails = detector.changed(frame(0, 0, 0))
+        assert not np.any(changed)
+        detector.update(thumbnails, [])
+
+    changed, _ = detector.changed(frame(0, 0, 0))
+    assert np.all(changed)
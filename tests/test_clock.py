@@ -0,0 +1,16 @@
+from reachy_tictactoe.clock import SimulatedClock
+
+
+def test_wait_until_times_out_from_an_awkward_start():
+    # 127.75 - 1e-14: the remaining time ends up too small to move the clock.
+    clock = SimulatedClock(127.74999999999996)
+
+    assert not clock.wait_until(lambda: False, timeout=2, period=0.05)
+    assert clock.time() >= 127.74999999999996 + 2
+
+
+def test_wait_until_stops_on_the_condition():
+    clock = SimulatedClock()
+
+    assert clock.wait_until(lambda: clock.time() >= 0.5, timeout=2, period=0.05)
+    assert 0.5 <= clock.time() < 0.6
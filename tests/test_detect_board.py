@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from reachy_tictactoe.detect_board import cluster_1d, corners_to_cases, find_board_corners
+
+
+def test_cluster_1d():
+    rng = np.random.RandomState(0)
+    centers = np.array([10, 50, 60, 200])
+    labels = rng.permutation(np.repeat(np.arange(4), 20))
+    values = centers[labels] + rng.uniform(-3, 3, len(labels))
+
+    np.testing.assert_array_equal(cluster_1d(values), labels)
+
+
+def test_cluster_1d_needs_enough_values():
+    with pytest.raises(ValueError):
+        cluster_1d([1, 1, 2, 3])
+
+
+def test_find_board_corners():
+    import cv2 as cv
+
+    # A slightly rotated 4x4 grid, lines 3 pixels wide.
+    positions = np.array([50, 150, 250, 350])
+    img = np.zeros((400, 400, 3), dtype=np.uint8)
+    for p in positions:
+        cv.line(img, (20, p - 4), (380, p + 4), (255, 255, 255), 3)
+        cv.line(img, (p + 4, 20), (p - 4, 380), (255, 255, 255), 3)
+
+    corners = find_board_corners(img)
+
+    # Line through (20, p - 4) and (380, p + 4) at x = q: y = p - 4 + 8 * (q - 20) / 360.
+    y = positions[:, np.newaxis] - 4 + 8 * (positions[np.newaxis] - 20) / 360
+    x = positions[np.newaxis] + 4 - 8 * (positions[:, np.newaxis] - 20) / 360
+    np.testing.assert_allclose(corners[..., 0], x, atol=3)
+    np.testing.assert_allclose(corners[..., 1], y, atol=3)
+
+    cases = corners_to_cases(corners)
+    assert cases.shape == (3, 3, 4)
+    assert np.all(cases[..., 0] < cases[..., 1])
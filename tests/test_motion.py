@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from reachy_tictactoe.motion import MotionLibrary, blend_waypoints, min_jerk
+
+
+def moves():
+    t = np.arange(50) / 100
+    return {
+        'base_pos': {'r_shoulder_pitch': np.array(10.0), 'r_elbow_pitch': np.array(-90.0)},
+        'wave': {'r_elbow_pitch': -90 + 20 * np.sin(t), 'r_wrist_roll': 5 * t},
+    }
+
+
+def check_moves(library):
+    assert set(library) == {'base_pos', 'wave'}
+    assert library.joints == ('r_shoulder_pitch', 'r_elbow_pitch', 'r_wrist_roll')
+
+    base_pos = library['base_pos']
+    assert not base_pos.is_trajectory and base_pos.duration == 0
+    assert base_pos['r_shoulder_pitch'].shape == () and float(base_pos['r_shoulder_pitch']) == 10
+    assert base_pos.start == base_pos.end == {'r_shoulder_pitch': 10, 'r_elbow_pitch': -90}
+
+    wave = library['wave']
+    assert wave.is_trajectory and wave.duration == 0.5
+    np.testing.assert_allclose(wave['r_elbow_pitch'], moves()['wave']['r_elbow_pitch'], rtol=1e-6)
+    np.testing.assert_array_equal(wave.time, np.arange(50, dtype=np.float32) / 100)
+
+    with pytest.raises(ValueError):
+        wave['r_wrist_roll'][0] = 0
+
+
+def test_library_from_the_npz_moves(tmp_path):
+    for name, move in moves().items():
+        np.savez(tmp_path / f'{name}.npz', **move)
+
+    check_moves(MotionLibrary(str(tmp_path)))
+
+
+def test_packed_library_round_trip(tmp_path):
+    packed_path = str(tmp_path / 'moves.pack')
+    MotionLibrary.from_moves(moves()).save(packed_path)
+
+    library = MotionLibrary(str(tmp_path / 'missing'), packed_path=packed_path)
+    check_moves(library)
+    assert isinstance(library.data, np.memmap)
+
+
+def test_joints_of_different_lengths_are_rejected():
+    with pytest.raises(ValueError):
+        MotionLibrary.from_moves({'bad': {'a': np.zeros(3), 'b': np.zeros(4)}})
+
+
+def test_min_jerk_ends():
+    p0, p1, v0, v1 = np.array((0.0, 10.0)), np.array((30.0, -5.0)), np.array((5.0, 0.0)), np.array((-2.0, 1.0))
+    positions, velocities = min_jerk(p0, p1, v0, v1, 2.0, np.array((0.0, 2.0)))
+
+    np.testing.assert_allclose(positions, np.c_[p0, p1], atol=1e-9)
+    np.testing.assert_allclose(velocities, np.c_[v0, v1], atol=1e-9)
+
+
+def test_min_jerk_rest_to_rest_peak_speed():
+    t = np.linspace(0, 1.5, 301)
+    positions, velocities = min_jerk(np.zeros(1), np.array((20.0, )), np.zeros(1), np.zeros(1), 1.5, t)
+
+    assert np.all(np.diff(positions) >= 0)
+    assert np.isclose(velocities.max(), 1.875 * 20 / 1.5)
+    np.testing.assert_allclose(np.gradient(positions[0], t), velocities[0], atol=0.05)
+
+
+def blend_library():
+    t = np.arange(100) / 100
+    return MotionLibrary.from_moves({
+        'a': {'j1': np.array(30.0), 'j2': np.array(-10.0)},
+        'b': {'j1': np.array(60.0), 'j2': np.array(-40.0)},
+        'c': {'j1': np.array(50.0)},
+        # Starts at (40, -40) going up on j1 and down on j2.
+        'traj': {'j1': 40 + 20 * t, 'j2': -40 - 30 * t},
+    })
+
+
+def goto_speed_bound(p0, p1, duration):
+    return 1.875 * np.abs(np.subtract(p1, p0)) / duration
+
+
+def test_blend_goes_through_the_gotos_faster_within_their_speeds():
+    library = blend_library()
+    start = {'j1': 0.0, 'j2': 0.0}
+    poses = [(0, 0), (30, -10), (60, -40), (50, -40)]
+    durations = (1, 1, 0.5)
+    trajectory = blend_waypoints(start, [(library[name], d) for name, d in zip('abc', durations)])
+
+    positions = np.array([trajectory['j1'], trajectory['j2']])
+    np.testing.assert_allclose(positions[:, -1], poses[-1], atol=1e-4)
+    assert positions.shape[1] < 100 * sum(durations)
+
+    # Continuous, and never faster than the fastest of the gotos.
+    bound = np.max([goto_speed_bound(p0, p1, d) for p0, p1, d in zip(poses, poses[1:], durations)], axis=0)
+    speeds = np.abs(np.diff(np.c_[poses[0], positions], axis=1)) * 100
+    assert np.all(speeds.max(axis=1) <= bound * 1.01)
+
+
+def test_blend_enters_a_trajectory_without_overshooting():
+    library = blend_library()
+    # j2 goes up to the trajectory start, which then goes down.
+    start = {'j1': 0.0, 'j2': -60.0}
+    trajectory = blend_waypoints(start, [(library['traj'], 1)])
+
+    positions = np.array([trajectory['j1'], trajectory['j2']])
+    np.testing.assert_allclose(positions[:, -1], (59.8, -69.7), atol=1e-4)
+
+    goto = positions[:, :-100]
+    assert goto[1].min() >= -60 - 1e-4 and goto[1].max() <= -40 + 1e-4
+    speeds = np.abs(np.diff(np.c_[(0, -60), goto], axis=1)) * 100
+    assert np.all(speeds.max(axis=1) <= goto_speed_bound((0, -60), (40, -40), 1) * 1.01)
+
+    # j1 goes on at the trajectory speed.
+    assert np.isclose((goto[0, -1] - goto[0, -2]) * 100, 20, atol=1)
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from reachy_tictactoe import vision
+from reachy_tictactoe.camera import CameraStream, Frame
+from reachy_tictactoe.clock import SimulatedClock
+from reachy_tictactoe.observer import BoardObserver
+from reachy_tictactoe.simulation import FakeCamera, SimulatedWorld, setup_fake_vision
+
+
+@pytest.fixture
+def world():
+    setup_fake_vision()
+    clock = SimulatedClock()
+    world = SimulatedWorld(clock)
+    world.place(0, 'cylinder')
+    world.place(4, 'cube')
+    return world
+
+
+def test_observes_the_board(world):
+    clock = world.clock
+    camera = CameraStream(FakeCamera(world), clock=clock)
+    observer = BoardObserver(camera, clock=clock)
+
+    camera.start()
+    observer.start()
+    try:
+        observation = observer.get_latest(clock.time(), stable=True, timeout=2)
+        assert observation is not None
+        np.testing.assert_array_equal(observation.board, world.board)
+
+        # The robot waits while the human plays.
+        clock.sleep(1)
+        world.place(8, 'cube')
+        observation = observer.get_latest(clock.time(), stable=True, timeout=2)
+        np.testing.assert_array_equal(observation.board, world.board)
+        assert observation.timestamp >= 1
+    finally:
+        observer.stop()
+        camera.stop()
+
+
+def test_no_stable_board_in_time(world):
+    observer = BoardObserver(camera=None, clock=world.clock)
+    observer.latest = observer.analyze(Frame(world.frame(), 0.0, 0))
+
+    assert observer.get_latest(stable=True, timeout=0.05) is not None
+    assert observer.get_latest(min_timestamp=1.0, timeout=0.05) is None
+
+
+def test_unsure_boxes_settle_as_empty(world):
+    boxes = vision.classifiers['ttt-boxes']
+    boxes.predict = lambda tensor: (boxes.band(tensor), 0.75)
+    observer = BoardObserver(camera=None, clock=world.clock)
+
+    for index in range(20):
+        observation = observer.analyze(Frame(world.frame(), float(index), index))
+
+    assert observation.stable
+    assert np.all(observation.board == 0)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from reachy_tictactoe.packed import ALIGNMENT, load_arrays, save_arrays
+
+
+@pytest.mark.parametrize('mmap', (True, False))
+def test_round_trip(tmp_path, mmap):
+    path = str(tmp_path / 'arrays.pack')
+    arrays = {
+        'values': np.arange(27, dtype=np.int8).reshape(3, 9),
+        'floats': np.linspace(0, 1, 5, dtype=np.float32),
+        'empty': np.zeros((0, 4), dtype=np.uint16),
+        'column': np.arange(12, dtype=np.int64).reshape(3, 4)[:, 1],
+    }
+    save_arrays(path, arrays, meta={'freq': 100})
+
+    loaded, meta = load_arrays(path, mmap=mmap)
+
+    assert meta == {'freq': 100}
+    assert list(loaded) == list(arrays)
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        np.testing.assert_array_equal(loaded[name], array)
+
+
+def test_arrays_are_aligned_read_only_views(tmp_path):
+    path = str(tmp_path / 'arrays.pack')
+    save_arrays(path, {'a': np.ones(3, dtype=np.uint8), 'b': np.ones(5, dtype=np.float64)})
+
+    arrays, _ = load_arrays(path, mmap=True)
+
+    for array in arrays.values():
+        assert array.ctypes.data % ALIGNMENT == 0
+        with pytest.raises(ValueError):
+            array[0] = 0
+
+
+def test_overwrite_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path / 'arrays.pack')
+    save_arrays(path, {'a': np.zeros(3)})
+    save_arrays(path, {'a': np.ones(3)})
+
+    arrays, _ = load_arrays(path, mmap=False)
+
+    np.testing.assert_array_equal(arrays['a'], np.ones(3))
+    assert [p.name for p in tmp_path.iterdir()] == ['arrays.pack']
+
+
+def test_not_a_packed_file(tmp_path):
+    path = tmp_path / 'arrays.pack'
+    path.write_bytes(b'version https://git-lfs.github.com/spec/v1\n')
+
+    with pytest.raises(ValueError):
+        load_arrays(str(path))
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from reachy_tictactoe import retime
+from reachy_tictactoe.motion import MotionLibrary
+
+
+freq = 100
+
+
+def min_jerk_move(duration=7.5):
+    u = np.arange(int(duration * freq)) / (duration * freq)
+    h = u ** 3 * (10 - 15 * u + 6 * u ** 2)
+    return np.stack([60 * h, 10 - 30 * h])
+
+
+def peaks(positions):
+    return [np.max(np.abs(d), axis=1) for d in retime.derivatives(positions, freq)]
+
+
+def test_min_jerk_move_stays_within_its_limits():
+    positions = min_jerk_move()
+    limits = retime.recorded_limits([positions], freq, 10)
+
+    retimed = retime.retime(positions, freq, *limits)
+
+    assert retimed.shape[1] < 1.1 * positions.shape[1]
+    for peak, limit in zip(peaks(retimed), limits):
+        assert np.all(peak <= limit)
+    assert np.allclose(retimed[:, [0, -1]], positions[:, [0, -1]])
+
+
+def test_quantized_noisy_recording():
+    # 0.29 deg quantization of the motors, plus 0.1 deg of noise.
+    positions = min_jerk_move()
+    limits = retime.recorded_limits([positions], freq, 10)
+    noisy = np.round(positions / 0.29) * 0.29 + np.random.default_rng(0).normal(0, 0.1, positions.shape)
+
+    retimed = retime.retime(noisy, freq, *limits)
+
+    assert retimed.shape[1] < 1.4 * positions.shape[1]
+    for peak, limit in zip(peaks(retimed), limits):
+        assert np.all(peak <= limit)
+
+
+def test_too_low_limits():
+    positions = min_jerk_move()
+    limits = [limit / 100 for limit in retime.recorded_limits([positions], freq, 10)]
+
+    with pytest.raises(ValueError):
+        retime.retime(positions, freq, *limits)
+
+
+def with_pauses(positions, at, duration):
+    # The arm held still for duration seconds at each of the samples at.
+    parts = np.split(positions, at, axis=1)
+    pause = int(duration * freq)
+    return np.concatenate([
+        np.c_[part, np.repeat(part[:, -1:], pause, axis=1)] if i < len(at) else part
+        for i, part in enumerate(parts)
+    ], axis=1)
+
+
+def library_of(positions):
+    return MotionLibrary.from_moves({
+        'move': dict(zip(('a', 'b'), positions)),
+        'base_pos': {'a': np.array(0.0), 'b': np.array(10.0)},
+    }, freq=freq)
+
+
+def test_pauses_are_dropped():
+    positions = with_pauses(min_jerk_move(), [250, 500], 2.0)
+    library = library_of(positions)
+
+    retimed = retime.retime_library(library)
+
+    assert retimed['move'].duration < 0.75 * library['move'].duration
+    np.testing.assert_allclose(retimed['move'].positions[:, [0, -1]], positions[:, [0, -1]], atol=1e-4)
+    np.testing.assert_array_equal(retimed['base_pos'].positions, library['base_pos'].positions)
+
+
+@pytest.mark.parametrize('noise', (0, 0.1))
+def test_retimed_moves_are_never_longer(noise):
+    positions = min_jerk_move() + np.random.default_rng(0).normal(0, noise, (2, 750))
+    library = library_of(positions)
+
+    retimed = retime.retime_library(library)
+
+    assert retimed['move'].duration <= library['move'].duration
+    if noise == 0:
+        # Already as fast as its limits allow, the move is kept as recorded.
+        np.testing.assert_array_equal(retimed['move'].positions, library['move'].positions)
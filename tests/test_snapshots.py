@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+
+from threading import Event
+
+from reachy_tictactoe.snapshots import SnapshotWriter
+
+
+def frame(seed=0):
+    # Noise, so the JPEGs are about the same (large) size.
+    return np.random.RandomState(seed).randint(0, 256, (48, 64, 3), dtype=np.uint8)
+
+
+def snapshots(path):
+    return sorted(name for name in os.listdir(path) if name.endswith('.jpg'))
+
+
+def test_every_nth_frame_is_kept(tmp_path):
+    writer = SnapshotWriter(path=str(tmp_path), every=3)
+    writer.start()
+    paths = [writer.add(frame(), 'frame') for _ in range(7)]
+    writer.stop()
+
+    assert [p is not None for p in paths] == [False, False, True, False, False, True, False]
+    assert snapshots(tmp_path) == ['00000001-frame.jpg', '00000002-frame.jpg']
+
+
+def test_frames_around_an_anomaly_are_kept(tmp_path):
+    writer = SnapshotWriter(path=str(tmp_path), every=0, context=2)
+    writer.start()
+    for _ in range(4):
+        writer.add(frame(), 'frame')
+    writer.anomaly('invalid')
+    for _ in range(3):
+        writer.add(frame(), 'frame')
+    writer.stop()
+
+    # The 2 frames before, the 2 after, not the others.
+    assert snapshots(tmp_path) == [
+        '00000001-frame-invalid.jpg', '00000002-frame-invalid.jpg',
+        '00000003-frame.jpg', '00000004-frame.jpg',
+    ]
+
+
+def test_oldest_snapshots_are_removed_over_max_size(tmp_path):
+    size = SnapshotWriter(path=str(tmp_path / 'one'), every=1)
+    size.start()
+    size.add(frame())
+    size.stop()
+    one = size.size
+
+    writer = SnapshotWriter(path=str(tmp_path / 'all'), every=1, max_size=int(2.5 * one))
+    writer.start()
+    for i in range(6):
+        writer.add(frame(i))
+    writer.stop()
+
+    names = snapshots(tmp_path / 'all')
+    assert names == ['00000005-frame.jpg', '00000006-frame.jpg']
+    assert writer.size == sum(os.path.getsize(tmp_path / 'all' / name) for name in names)
+    assert writer.size <= writer.max_size
+
+
+def test_frames_are_dropped_when_the_queue_is_full(tmp_path):
+    writer = SnapshotWriter(path=str(tmp_path), every=1, queue_size=2)
+    release = Event()
+    write = writer._write
+    writer._write = lambda img, path: release.wait() and write(img, path)
+
+    writer.start()
+    paths = [writer.add(frame()) for _ in range(6)]
+    release.set()
+    writer.stop()
+
+    # The writer holds at most one frame, the queue two.
+    assert writer.nb_dropped >= 3
+    assert paths.count(None) == writer.nb_dropped
+    assert len(snapshots(tmp_path)) == 6 - writer.nb_dropped
+
+
+def test_numbering_carries_on_from_the_previous_runs(tmp_path):
+    for _ in range(2):
+        writer = SnapshotWriter(path=str(tmp_path), every=1)
+        writer.start()
+        writer.add(frame())
+        writer.add(frame())
+        writer.stop()
+
+    assert snapshots(tmp_path) == ['0000000%d-frame.jpg' % i for i in range(1, 5)]
+    assert len(writer.files) == 4
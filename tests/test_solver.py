@@ -0,0 +1,51 @@
+from functools import lru_cache
+
+import numpy as np
+
+from reachy_tictactoe import solver
+from reachy_tictactoe.board import NB_CODES, decode, is_final
+
+
+@lru_cache(maxsize=None)
+def minimax(board, player):
+    """Value of the board for player 1 with player to move, by brute force.
+
+    Same scoring as solver.build_table, without its symmetries.
+    """
+    for a, b, c in ((0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)):
+        if board[a] != 0 and board[a] == board[b] == board[c]:
+            return (1 if board[a] == 1 else -1) * (board.count(0) + 1)
+    if 0 not in board:
+        return 0
+
+    children = [minimax(play(board, a, player), 3 - player) for a in range(9) if board[a] == 0]
+    return max(children) if player == 1 else min(children)
+
+
+def play(board, a, player):
+    return board[:a] + (player, ) + board[a + 1:]
+
+
+def test_solver_matches_minimax_on_every_position():
+    nb_positions = 0
+
+    for code in range(NB_CODES):
+        board = decode(np.array(code))
+        if is_final(board):
+            continue
+
+        for player in (1, 2):
+            try:
+                values = solver.action_values(board, player)
+            except ValueError:
+                continue
+            nb_positions += 1
+
+            key = tuple(board.tolist())
+            children = {a: minimax(play(key, a, player), 3 - player) for a in np.where(board == 0)[0]}
+            assert {a: int(values[a]) for a in children} == children
+
+            best = (max if player == 1 else min)(children.values())
+            assert solver.best_actions(board, player) == sorted(a for a, v in children.items() if v == best)
+
+    assert nb_positions > 1000
@@ -0,0 +1,40 @@
+import numpy as np
+
+from reachy_tictactoe.timing import Profiler
+
+
+def test_percentiles_are_close_to_the_exact_ones():
+    durations = np.random.default_rng(0).lognormal(-4, 1, 10000)
+
+    profiler = Profiler()
+    for d in durations:
+        profiler.record('span', d)
+    report = profiler.report()['span']
+
+    assert report['count'] == len(durations)
+    assert np.isclose(report['total'], durations.sum())
+    assert report['max'] == durations.max()
+    for q in (50, 95):
+        assert abs(report[f'p{q}'] / np.percentile(durations, q) - 1) < 0.07
+
+
+def test_extend_merges_the_spans():
+    first, second = Profiler(), Profiler()
+    for i in range(100):
+        first.record('span', 0.01)
+        second.record('span', 0.1)
+    first.extend(second)
+    report = first.report()['span']
+
+    assert report['count'] == 200
+    assert first.stats['span'].histogram.sum() == 200
+    assert np.isclose(report['p50'], 0.01, rtol=0.07)
+    assert np.isclose(report['p95'], 0.1, rtol=0.07)
+    assert report['max'] == 0.1
+
+
+def test_zero_durations():
+    profiler = Profiler()
+    profiler.record('span', 0.0)
+
+    assert profiler.report()['span']['p50'] == 0.0
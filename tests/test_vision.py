@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from reachy_tictactoe import vision
+from reachy_tictactoe.clock import SimulatedClock
+from reachy_tictactoe.simulation import SimulatedWorld, setup_fake_vision
+
+
+@pytest.mark.parametrize('reader', ('split', 'fused'))
+def test_read_the_board(reader):
+    setup_fake_vision(reader)
+    world = SimulatedWorld(SimulatedClock())
+    for box, piece in ((0, 'cylinder'), (4, 'cube'), (5, 'cylinder'), (6, 'cube')):
+        world.place(box, piece)
+
+    board_img = vision.warp_board(world.frame())
+    valid, cells, _ = vision.read_board(board_img)
+
+    assert valid
+    np.testing.assert_array_equal(cells.reshape(9), world.board)
+
+
+def test_split_cells_are_box_inputs():
+    setup_fake_vision('split')
+    shape = vision.board_shape()
+
+    cells = vision.board_cells(np.zeros(shape + (3, ), dtype=np.uint8))
+
+    assert len(cells) == 9
+    assert all(cell.shape[:2] == vision.classifiers['ttt-boxes'].input_shape for cell in cells)
+
+
+def test_validity_view_covers_the_board_rect():
+    setup_fake_vision('split')
+
+    # Every pixel of the frame holds its coordinates, divided by 4.
+    y, x = np.mgrid[0:720, 0:1024] // 4
+    frame = np.stack((np.zeros_like(x), y, x), axis=-1).astype(np.uint8)
+    # Warped and turned RGB, so the coordinates are in the 2nd and 1st channels.
+    board_img = vision.warp_board(frame).astype(int) * 4
+
+    # Up to the half pixel of the (small) rectified board, about 5 frame pixels.
+    lx, rx, ly, ry = vision.board_rect
+    assert board_img[..., 0].min() <= lx + 10 and board_img[..., 0].max() >= rx - 10
+    assert board_img[..., 1].min() <= ly + 10 and board_img[..., 1].max() >= ry - 10
+
+
+def test_fused_reading_is_shared_until_the_next_warp():
+    setup_fake_vision('fused')
+    world = SimulatedWorld(SimulatedClock())
+    model = vision.classifiers[vision.fused_model]
+
+    nb_runs = []
+    run = model.run
+    model.run = lambda tensor: nb_runs.append(1) or run(tensor)
+
+    board_img = vision.warp_board(world.frame())
+    assert vision.is_board_valid(None, board_img=board_img)
+    vision.get_board_cells(None, board_img=board_img)
+    assert len(nb_runs) == 1
+
+    vision.get_board_configuration(world.frame())
+    assert len(nb_runs) == 2
+
+
+def test_auto_reader_is_resolved_once(monkeypatch):
+    setup_fake_vision('split')
+    vision.configure(reader_name='auto')
+
+    nb_checks = []
+    monkeypatch.setattr(vision.os.path, 'exists', lambda path: nb_checks.append(path) or False)
+
+    assert not vision.use_fused_reader()
+    assert not vision.use_fused_reader()
+    assert len(nb_checks) == 1
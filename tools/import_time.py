@@ -0,0 +1,54 @@
+"""Measure the cold import time of the tictactoe modules.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and
+reports the total import time along with the slowest imported modules, e.g.:
+
+    python tools/import_time.py reachy_tictactoe.game_launcher --repeat 5
+"""
+import argparse
+import subprocess
+import sys
+
+
+def import_times(module):
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if proc.returncode != 0:
+        traceback = [line for line in proc.stderr.splitlines() if not line.startswith('import time:')]
+        sys.exit(f'Importing {module} failed:\n' + '\n'.join(traceback))
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('modules', nargs='*', default=['reachy_tictactoe.game_launcher'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        # Keep the fastest run, the others are mostly disk cache noise.
+        runs = [import_times(module) for _ in range(args.repeat)]
+        best = min(runs, key=lambda times: times[module][1])
+
+        print(f'{module}: {best[module][1] / 1000:.1f} ms')
+        print(f'  {"cumulative [ms]":>16} {"self [ms]":>10}  module')
+
+        slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (self_us, cumulative_us) in slowest[: args.top]:
+            print(f'  {cumulative_us / 1000:16.1f} {self_us / 1000:10.1f}  {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,4 @@
-import os
-import numpy as np
-
-from glob import glob
-
-dir_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "reachy_tictactoe", "moves")
-
-
-names = [
-    os.path.splitext(os.path.basename(f))[0]
-    for f in glob(os.path.join(dir_path, '*.npz'))
-]
-
-moves = {
-    name: np.load(os.path.join(dir_path, f'{name}.npz'))
-    for name in names
-}
+from reachy_tictactoe.moves import moves
 
 
 rest_pos = {
@@ -40,8 +24,8 @@ base_pos = {
 
 for name, move in moves.items():
     print(name)
-    print(f'Motors: {move.files}')
-    if np.ndim(move[move.files[0]]) == 0:
+    print(f'Motors: {list(move.joints)}')
+    if not move.is_trajectory:
         print('Position')
     else:
         print('Trajectory')
\ No newline at end of file
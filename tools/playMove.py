@@ -1,10 +1,8 @@
-import os
-import numpy as np
 from reachy import Reachy, parts
 from reachy.trajectory import TrajectoryPlayer
 from collections import OrderedDict
 
-from glob import glob
+from reachy_tictactoe.moves import moves
 
 
 def patch_force_gripper(forceGripper):
@@ -31,17 +29,6 @@ def patch_force_gripper(forceGripper):
 
 parts.arm.RightForceGripper = patch_force_gripper(parts.arm.RightForceGripper)
 
-dir_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "reachy_tictactoe", "moves")
-
-
-names = [
-    os.path.splitext(os.path.basename(f))[0]
-    for f in glob(os.path.join(dir_path, "*.npz"))
-]
-
-moves = {name: np.load(os.path.join(dir_path, f"{name}.npz")) for name in names}
-
-
 rest_pos = {
     "right_arm.shoulder_pitch": 50,
     "right_arm.shoulder_roll": -15,
@@ -91,7 +78,7 @@ while True:
     if True:
         move = moves[selection]
 
-        if np.ndim(move[move.files[0]]) == 0:  # Position
+        if not move.is_trajectory:  # Position
             reachy.goto(
                 goal_positions=move,
                 duration=1,
@@ -100,12 +87,8 @@ while True:
                 starting_point="goal_position",
             )
         else:
-            j = {
-                m: j for j, m in zip(np.array(list(move.values()))[:, 0], list(move.keys()))
-            }
-
             reachy.goto(
-                goal_positions=j,
+                goal_positions=move.start,
                 duration=0.5,
                 wait=True,
                 interpolation_mode="minjerk",
@@ -3,25 +3,9 @@ from reachy.trajectory import TrajectoryPlayer
 from collections import OrderedDict
 import time
 from threading import Thread, Event
-import os
 import numpy as np
 
-from glob import glob
-
-dir_path = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
-    "reachy_tictactoe",
-    "moves",
-)
-
-
-names = [
-    os.path.splitext(os.path.basename(f))[0]
-    for f in glob(os.path.join(dir_path, "*.npz"))
-]
-
-moves = {name: np.load(os.path.join(dir_path, f"{name}.npz")) for name in names}
-
+from reachy_tictactoe.moves import moves
 
 def patch_force_gripper(forceGripper):
     def __init__(self, root, io):
@@ -84,14 +68,7 @@ class LimitedTictactoePlayground(object):
         self.goto_base_position()
         # self.reachy.head.look_at(0.5, 0, -0.4, duration=1, wait=False)
         m = moves['shuffle-board']  # Trevor change
-        j = {
-            m: j
-            for j, m in zip(
-                np.array(list(m.values()))[:, 0],
-                list(m.keys())
-            )
-        }
-        self.goto_position(j, duration=0.5, wait=True)
+        self.goto_position(m.start, duration=0.5, wait=True)
         TrajectoryPlayer(self.reachy, m).play(wait=True)
         self.goto_rest_position()
         # self.reachy.head.look_at(1, 0, 0, duration=1, wait=True)
@@ -135,8 +112,7 @@ class LimitedTictactoePlayground(object):
 
         # Put it in box_index
         put = moves[f"put_{box_index}"]  # Trevor change
-        j = {m: j for j, m in zip(np.array(list(put.values()))[:, 0], list(put.keys()))}
-        self.goto_position(j, duration=0.5, wait=True)
+        self.goto_position(put.start, duration=0.5, wait=True)
         TrajectoryPlayer(self.reachy, put).play(wait=True)
 
         self.reachy.right_arm.hand.open()
@@ -162,28 +138,14 @@ class LimitedTictactoePlayground(object):
     def run_my_turn(self):
         self.goto_base_position()
         m = moves['my-turn']  # Trevor change
-        j = {
-            m: j
-            for j, m in zip(
-                np.array(list(m.values()))[:, 0],
-                list(m.keys())
-            )
-        }
-        self.goto_position(j, duration=0.5, wait=True)
+        self.goto_position(m.start, duration=0.5, wait=True)
         TrajectoryPlayer(self.reachy, m).play(wait=True)
         self.goto_rest_position()
 
     def run_your_turn(self):
         self.goto_base_position()
         m = moves['your-turn']  # Trevor change
-        j = {
-            m: j
-            for j, m in zip(
-                np.array(list(m.values()))[:, 0],
-                list(m.keys())
-            )
-        }
-        self.goto_position(j, duration=0.5, wait=True)
+        self.goto_position(m.start, duration=0.5, wait=True)
         TrajectoryPlayer(self.reachy, m).play(wait=True)
         self.goto_rest_position()
 